@@ -0,0 +1,106 @@
+"""Micro-benchmark of the sequence matchers on long outputs
+
+Compares the matchers with the previous implementation, which searched each pattern with its own regex
+call from the last position and highlighted the output by slicing it once per span.
+Also times `AlignmentMatcher`, including answers made of one repeated unit, whose occurrences in the output
+are candidates for every unit of the answer.
+
+    python benchmarks/bench_matcher.py [--lines 10000] [--repeat 5]
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import re
+import timeit
+from collections.abc import Callable
+
+from colorama import Fore
+from rich.console import Console
+from rich.table import Table
+from stutestpy.matcher import AlignmentMatcher, LineSequenceMatcher, TokenSequenceMatcher
+from stutestpy.utils import colored
+
+
+def legacy_highlight(s: str, matched: list[tuple[int, int]]) -> str:
+    for l, r in reversed(matched):
+        s = s[:l] + colored(s[l:r], fg=Fore.CYAN) + s[r:]
+    return s
+
+
+def legacy_match(patterns: list[re.Pattern[str]], output: str) -> str:
+    last_pos = 0
+    matched: list[tuple[int, int]] = []
+    for pat in patterns:
+        if m := pat.search(output, last_pos):
+            matched.append(m.span())
+            last_pos = m.span()[1]
+    return legacy_highlight(output, matched)
+
+
+def make_outputs(lines: int) -> tuple[str, dict[str, str]]:
+    rng = random.Random(0)
+    ans = [f"case {i}: {rng.randint(0, 10**6)} {rng.choice(['yes', 'no'])}" for i in range(lines)]
+    outputs = {
+        "correct": "\n".join(ans) + "\n",
+        "1% wrong": "\n".join("wrong" if i % 100 == 7 else l for i, l in enumerate(ans)),
+        "10% wrong": "\n".join("wrong" if i % 10 == 7 else l for i, l in enumerate(ans)),
+        "50% wrong": "\n".join("wrong" if i % 2 else l for i, l in enumerate(ans)),
+        "repeated": "\n".join(["0"] * lines),
+    }
+    return "\n".join(ans) + "\n", outputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ans, outputs = make_outputs(args.lines)
+    # 重复答案行用于体现缓存的效果
+    answers = {"repeated": "\n".join(["0"] * args.lines + ["1"])}
+
+    table = Table(title=f"Sequence matchers on {args.lines}-line outputs (best of {args.repeat}, ms)")
+    for col in ("matcher", "output", "legacy", "current", "speedup"):
+        table.add_column(col, justify="right" if col not in ("matcher", "output") else "left")
+
+    for cls in (LineSequenceMatcher, TokenSequenceMatcher):
+        for name, output in outputs.items():
+            matcher = cls(answers.get(name, ans))
+            patterns = [m[-1] for m in matcher.matchers]
+            benches: list[Callable[[], object]] = [
+                lambda patterns=patterns, output=output: legacy_match(patterns, output),
+                lambda matcher=matcher, output=output: matcher(output),
+            ]
+            # 匹配失败时会打印，计时时屏蔽
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                legacy, current = (min(timeit.repeat(b, number=1, repeat=args.repeat)) * 1e3 for b in benches)
+            table.add_row(cls.__name__, name, f"{legacy:.1f}", f"{current:.1f}", f"{legacy / current:.1f}x")
+
+    Console().print(table)
+
+    # 对齐的代价与答案单元在输出中的出现次数有关，重复的单元是最坏情况
+    repeated = "0\n" * (AlignmentMatcher(ans).max_output // 2)
+    alignments = {
+        "correct": (ans, outputs["correct"]),
+        "10% wrong": (ans, outputs["10% wrong"]),
+        "repeated": (answers["repeated"], repeated),
+        "repeated, 1% other": (answers["repeated"], repeated.replace("0\n" * 100, "0\n" * 99 + "1\n")),
+    }
+    table = Table(title=f"AlignmentMatcher on {args.lines}-unit answers (best of {args.repeat}, ms)")
+    for col in ("output", "output chars", "matched", "time"):
+        table.add_column(col, justify="left" if col == "output" else "right")
+    for name, (answer, output) in alignments.items():
+        matcher = AlignmentMatcher(answer)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            m = matcher(output)
+            best = min(timeit.repeat(lambda m=matcher, o=output: m(o), number=1, repeat=args.repeat)) * 1e3
+        table.add_row(name, str(len(output)), f"{len(m.matched)}/{matcher.num_patterns}", f"{best:.1f}")
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Benchmark of the whole grading pipeline on a synthetic class
+
+Generates N C++ submissions mixing correct, wrong-answer, runtime-error, time-limit and compile-error
+programs, grades them with `Tester.test_many`, and reports the time spent in each stage
+(find, compile, run, check), the throughput and the per-submission latency percentiles.
+Results are saved as JSON, and can be compared with a previous run on the same machine.
+
+    python benchmarks/bench_pipeline.py [-n 40] [--jobs 2 | --pipeline] [--compare old.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shlex
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from collections.abc import Iterator, Sequence
+from datetime import datetime
+from pathlib import Path
+from typing import override
+
+import rich
+from result import Result
+from rich.console import Console
+from rich.table import Table
+from stutestpy.checker import CheckerResult, StreamMonitor
+from stutestpy.compiler import Compiler
+from stutestpy.logs import TestLog
+from stutestpy.runner import Execution, Stdin
+
+from stutestpy import (
+    FindSubmissionByKeywords,
+    FixedLoader,
+    LineSequenceMatcher,
+    LocalCompiler,
+    Pipeline,
+    SequenceMatchChecker,
+    TestCases,
+    Tester,
+    TestRunner,
+    WorkTree,
+)
+from stutestpy import results as R
+
+console = Console(stderr=True)
+
+PROGRAMS = {
+    "AC": "int main() { long a, b; std::cin >> a >> b; std::cout << a + b << '\\n'; }",
+    "WA": "int main() { long a, b; std::cin >> a >> b; std::cout << a - b << '\\n'; }",
+    "RE": "int main() { long a, b; std::cin >> a >> b; if (a + b >= 0) std::abort(); }",
+    "TLE": "int main() { volatile unsigned long x = 0; for (;;) ++x; }",
+    "CE": "int main() { long a; std::cin >> a; std::cout << undefined_variable << '\\n'; }",
+}
+MIX = {"AC": 0.5, "WA": 0.2, "RE": 0.1, "TLE": 0.1, "CE": 0.1}
+STAGES = ("find", "compile", "run", "check")
+
+
+class Recorder:
+    """Stage durations and per-submission latencies, shared by all threads"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.stages: dict[str, list[float]] = defaultdict(list)
+        self.started: dict[str, float] = {}
+        self.latency: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name].append(time.perf_counter() - start)
+
+    def start(self, submitter: str) -> None:
+        with self.lock:
+            self.started.setdefault(submitter, time.perf_counter())
+
+    def finish(self, submitter: str) -> None:
+        with self.lock:
+            self.latency[submitter] = time.perf_counter() - self.started[submitter]
+
+
+# 流水线会复制各组件，计时数据放在模块级
+recorder = Recorder()
+
+
+class TimedWorkTree(WorkTree):
+    @override
+    def set_root(self, root: str | Path) -> bool:
+        with recorder.stage("find"):
+            return super().set_root(root)
+
+    @override
+    def compile_with(self, compiler: Compiler, name: str = "example") -> Result[Path, R.CE]:
+        with recorder.stage("compile"):
+            return super().compile_with(compiler, name)
+
+
+class TimedRunner(TestRunner):
+    @override
+    def run_many(
+        self, exe: Path, stdins: Sequence[Stdin], monitors: Sequence[StreamMonitor | None] | None = None
+    ) -> list[Execution]:
+        with recorder.stage("run"):
+            return super().run_many(exe, stdins, monitors)
+
+
+class TimedChecker(SequenceMatchChecker):
+    @override
+    def check(self, index: int, stdin: str, stdout: str, ans: str) -> CheckerResult:
+        with recorder.stage("check"):
+            return super().check(index, stdin, stdout, ans)
+
+
+class TimedTester(Tester):
+    @override
+    def build(self, folder: Path, log: TestLog, name: str = "example") -> Path | None:
+        recorder.start(log.submitter)
+        exe = super().build(folder, log, name)
+        if exe is None:
+            recorder.finish(log.submitter)
+        return exe
+
+    @override
+    def judge(self, exe: Path, log: TestLog) -> None:
+        super().judge(exe, log)
+        recorder.finish(log.submitter)
+
+
+def generate(root: Path, n: int, cases: int, seed: int) -> Counter[str]:
+    """Write `cases` test cases to `root/data` and `n` submissions to `root/class`"""
+    rng = random.Random(seed)
+    data = root / "data"
+    data.mkdir(parents=True)
+    for i in range(cases):
+        a, b = rng.randint(0, 10**9), rng.randint(0, 10**9)
+        (data / f"add-{i}.in").write_text(f"{a} {b}\n")
+        (data / f"add-{i}.ans").write_text(f"{a + b}\n")
+
+    kinds: Counter[str] = Counter()
+    for i in range(n):
+        kind = rng.choices(list(MIX), weights=list(MIX.values()))[0]
+        kinds[kind] += 1
+        folder = root / "class" / f"student-{i:04}"
+        folder.mkdir(parents=True)
+        # 注释使每份提交内容不同，避免编译缓存命中
+        source = f"// submission {i} ({kind})\n#include <cstdlib>\n#include <iostream>\n{PROGRAMS[kind]}\n"
+        (folder / "main.cpp").write_text(source)
+    return kinds
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "total": sum(values),
+        "mean": sum(values) / len(values) if values else float("nan"),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values, default=float("nan")),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(prefix="stutestpy-bench-") as tmp:
+        root = Path(tmp)
+        kinds = generate(root, args.n, args.cases, args.seed)
+        (root / "work").mkdir()
+        tester = TimedTester(
+            worktree=TimedWorkTree(root / "work", loader=FixedLoader([FindSubmissionByKeywords(["main"])])),
+            testcases=TestCases(root / "data", "add"),
+            compiler=LocalCompiler(shlex.split(args.compiler) if args.compiler else None),
+            runner=TimedRunner(time_limit=args.time_limit, concurrency=args.concurrency),
+            checker=TimedChecker(LineSequenceMatcher),
+        )
+        pipeline = Pipeline(compile_workers=args.compile_workers) if args.pipeline else None
+
+        # 屏蔽测试过程的输出
+        output = rich.get_console()
+        with contextlib.redirect_stdout(io.StringIO()), open(os.devnull, "w") as devnull:
+            saved, output.file = output.file, devnull
+            start = time.perf_counter()
+            try:
+                logs = tester.test_many(root / "class", jobs=args.jobs, pipeline=pipeline, batch=True)
+            finally:
+                wall = time.perf_counter() - start
+                output.file = saved
+
+    verdicts: Counter[str] = Counter()
+    for log in logs:
+        verdicts[log.status or ("AC" if log.passed == args.cases else "FAIL")] += 1
+
+    in_process = args.jobs <= 1
+    return {
+        "meta": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "machine": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args) | {"compare": None, "out": None},
+        },
+        "submissions": args.n,
+        "mix": dict(kinds),
+        "verdicts": dict(verdicts),
+        "wall": wall,
+        "throughput_per_min": args.n / wall * 60,
+        # 多进程时各阶段在子进程中计时，无法收集
+        "stages": {s: summarize(recorder.stages[s]) for s in STAGES} if in_process else None,
+        "latency": summarize(list(recorder.latency.values())) if in_process else None,
+    }
+
+
+def report(result: dict, baseline: dict | None) -> None:
+    def ratio(path: list[str]) -> str:
+        if baseline is None:
+            return ""
+        old, new = baseline, result
+        for key in path:
+            old, new = (old or {}).get(key), (new or {}).get(key)
+        return f"{new / old:.2f}x" if old and new else "-"
+
+    console.print(
+        f"{result['submissions']} submissions in {result['wall']:.2f}s: "
+        f"[bold]{result['throughput_per_min']:.1f}[/] submissions/min {ratio(['throughput_per_min'])}"
+    )
+    if result["stages"] is None:
+        console.print("Stage timings are not available with multiple jobs")
+        return
+
+    table = Table(title="Stage times (ms)")
+    for col in ("stage", "count", "total", "mean", "p50", "p90", "p99", "max", "total vs baseline"):
+        table.add_column(col, justify="left" if col == "stage" else "right")
+    rows = [(s, ["stages", s]) for s in STAGES] + [("latency", ["latency"])]
+    for name, path in rows:
+        stats = result
+        for key in path:
+            stats = stats[key]
+        table.add_row(
+            name,
+            str(stats["count"]),
+            *(f"{stats[k] * 1e3:.1f}" for k in ("total", "mean", "p50", "p90", "p99", "max")),
+            ratio([*path, "total"]),
+        )
+    console.print(table)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=40, help="number of submissions")
+    parser.add_argument("--cases", type=int, default=5, help="number of test cases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compiler", help="compiler command line, LocalCompiler's default if omitted")
+    parser.add_argument("--time-limit", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=1, help="test cases run at the same time")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--pipeline", action="store_true", help="compile in background threads")
+    parser.add_argument("--compile-workers", type=int, default=2)
+    parser.add_argument("--out", type=Path, help="where to save the JSON results")
+    parser.add_argument("--compare", type=Path, help="results of a previous run to compare with")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    result = run(args)
+    report(result, baseline)
+
+    out = args.out or Path("benchmarks/results") / f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    console.print(f"Save results to {out}")
+
+
+if __name__ == "__main__":
+    main()
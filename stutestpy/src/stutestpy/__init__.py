@@ -1,26 +1,40 @@
+from .cache import CompileCache
 from .cases import TestCases
-from .checker import Checker, SequenceMatchChecker
+from .checker import Checker, ExactMatchChecker, SequenceMatchChecker
 from .compiler import LocalCompiler
 from .finder import FindHeader, FindSubmissionByKeywords, SubmissionFinder
-from .matcher import LineSequenceMatcher, SequenceMatcher, TokenSequenceMatcher
+from .harness import HarnessRunner
+from .matcher import AlignmentMatcher, LineSequenceMatcher, SequenceMatcher, TokenSequenceMatcher
+from .pch import PrecompiledHeader
+from .pipeline import Pipeline
 from .results import TestResult
+from .review import review_pending
 from .runner import TestRunner
+from .symbolizer import Symbolizer
 from .tester import Tester
 from .worktree import ConditionalLoader, EnsuredLoader, FixedLoader, WorkTree
 
 __all__ = [
+    "CompileCache",
     "TestCases",
     "Checker",
+    "ExactMatchChecker",
     "SequenceMatchChecker",
     "LocalCompiler",
     "FindHeader",
     "FindSubmissionByKeywords",
     "SubmissionFinder",
+    "AlignmentMatcher",
     "LineSequenceMatcher",
     "SequenceMatcher",
     "TokenSequenceMatcher",
+    "PrecompiledHeader",
+    "Pipeline",
     "TestResult",
+    "review_pending",
     "TestRunner",
+    "HarnessRunner",
+    "Symbolizer",
     "Tester",
     "ConditionalLoader",
     "EnsuredLoader",
@@ -0,0 +1,32 @@
+import argparse
+from pathlib import Path
+
+from .cases import TestCases
+from .checker import SequenceMatchChecker
+from .matcher import AlignmentMatcher, LineSequenceMatcher, TokenSequenceMatcher
+from .review import review_pending
+
+MATCHERS = {"line": LineSequenceMatcher, "token": TokenSequenceMatcher, "align": AlignmentMatcher}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="stutestpy")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    review = commands.add_parser("review", help="manually judge the pending cases of a batch run")
+    review.add_argument("log", type=Path, help="logs saved by Tester.test_many")
+    review.add_argument("data", type=Path, help="test case folder")
+    review.add_argument("prefix", help="test case prefix")
+    review.add_argument("--no-stdin", action="store_true", help="test cases have no input files")
+    review.add_argument("--matcher", choices=MATCHERS, default="line")
+    review.add_argument("--default-judge", action="store_true", help="judge as AC unless answered no")
+
+    args = parser.parse_args()
+    if args.command == "review":
+        testcases = TestCases(args.data, args.prefix, has_stdin=not args.no_stdin)
+        checker = SequenceMatchChecker(MATCHERS[args.matcher], default_judge=args.default_judge)
+        review_pending(args.log, testcases, checker)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+type StrPath = str | Path
+
+
+class CompileCache:
+    """On-disk content-addressed cache of compiled binaries with LRU eviction
+
+    Entries are stored as `root/{key[:2]}/{key}`. An entry's mtime is refreshed on every hit,
+    and the least recently used entries are evicted once the total size exceeds `max_size`,
+    down to 90% of it, so that the directory is only walked again after a number of new entries.
+    """
+
+    def __init__(self, root: StrPath, max_size: int = 2 << 30) -> None:
+        self.root = Path(root)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # 缓存总大小的估计值，首次写入时统计；超过上限时才重新遍历目录
+        self._size: int | None = None
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str, dest: Path) -> bool:
+        """Materialize a cached binary at `dest`
+
+        Returns:
+            bool: whether the entry was found
+        """
+        entry = self._entry(key)
+        try:
+            os.utime(entry)
+            dest.unlink(missing_ok=True)
+            try:
+                os.link(entry, dest)
+            except OSError:
+                shutil.copy2(entry, dest)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, key: str, built: Path) -> None:
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再替换，多进程同时写入也是安全的
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix=".tmp-")
+        os.close(fd)
+        shutil.copy2(built, tmp)
+        size = os.stat(tmp).st_size
+        os.replace(tmp, entry)
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_size:
+                self.evict()
+
+    def evict(self) -> None:
+        entries: list[tuple[float, int, Path]] = []
+        for d in self.root.iterdir():
+            if not d.is_dir():
+                continue
+            for f in d.iterdir():
+                if f.name.startswith(".tmp-"):
+                    continue
+                try:
+                    st = f.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, f))
+        total = sum(size for _, size, _ in entries)
+        # 超出上限时多删除一些，避免此后每次写入都遍历目录
+        target = self.max_size if total <= self.max_size else self.max_size * 9 // 10
+        for _, size, f in sorted(entries):
+            if total <= target:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+        self._size = total
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"Compile cache: {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
@@ -1,25 +1,76 @@
+import threading
+from collections import OrderedDict
 from collections.abc import Generator
 from pathlib import Path
 from typing import Any
 
 import rich
 
+from .fingerprint import hash_files
+
 console = rich.get_console()
 
 
 class TestCases:
-    def __init__(self, root: str | Path, prefix: str, *, has_stdin: bool = True) -> None:
+    def __init__(self, root: str | Path, prefix: str, *, has_stdin: bool = True, cache_size: int = 64 << 20) -> None:
+        """
+        Args:
+            root: folder containing `{prefix}-{i}.in` and `{prefix}-{i}.ans`
+            prefix: name prefix of the test case files
+            has_stdin: whether the program reads `.in` files from stdin
+            cache_size: max bytes of file contents kept in memory. Files are only read when needed.
+        """
         self.prefix = prefix
         self.has_stdin = has_stdin
+        self.cache_size = cache_size
         root = Path(root)
         self.cases = sorted(root.glob(rf"{prefix}-*.ans"), key=lambda x: int(x.stem.split("-")[-1])) or list(
             root.glob(rf"{prefix}.ans")
         )
-        self.stdin_str = [f.with_suffix(".in").read_text() for f in self.cases if f.with_suffix(".in").exists()]
-        self.ans_str = [f.read_text() for f in self.cases]
+        self.input_files = [f.with_suffix(".in") for f in self.cases if f.with_suffix(".in").exists()]
+        if has_stdin and len(self.input_files) != len(self.cases):
+            raise ValueError(f"Missing .in files for test cases {prefix} in {root}")
         if not self.cases:
             console.print("WARN: no test case found!", style="red")
 
+        self._cache: OrderedDict[Path, str] = OrderedDict()
+        self._cached = 0
+        self._lock = threading.Lock()
+
+    def _read(self, file: Path) -> str:
+        """Read a file through a LRU cache bounded by `cache_size`"""
+        with self._lock:
+            if (text := self._cache.get(file)) is not None:
+                self._cache.move_to_end(file)
+                return text
+        text = file.read_text()
+        with self._lock:
+            if file not in self._cache and len(text) <= self.cache_size:
+                self._cache[file] = text
+                self._cached += len(text)
+                while self._cached > self.cache_size:
+                    _, old = self._cache.popitem(last=False)
+                    self._cached -= len(old)
+        return text
+
+    def inputs(self) -> list[Path | None]:
+        """Input files to feed as stdin, in iteration order. None means empty stdin."""
+        return list(self.input_files) if self.has_stdin else [None]
+
+    def stdin(self, index: int) -> str:
+        return self._read(self.input_files[index]) if self.has_stdin else ""
+
+    def answer(self, index: int) -> str:
+        return self._read(self.cases[index])
+
+    def fingerprints(self) -> list[str]:
+        """Content hashes of test cases, in iteration order"""
+        if self.has_stdin:
+            pairs: list[tuple[Path | None, Path]] = [(f, a) for f, a in zip(self.input_files, self.cases, strict=True)]
+        else:
+            pairs = [(None, self.cases[0])]
+        return [hash_files([f for f in pair if f]) for pair in pairs]
+
     def __len__(self) -> int:
         return len(self.cases)
 
@@ -32,7 +83,5 @@ class TestCases:
         return self._generator()
 
     def _generator(self) -> Generator[tuple[str, str], Any, None]:
-        if self.has_stdin:
-            yield from zip(self.stdin_str, self.ans_str, strict=True)
-        else:
-            yield ("", self.ans_str[0])
+        for i in range(len(self.inputs())):
+            yield (self.stdin(i), self.answer(i))
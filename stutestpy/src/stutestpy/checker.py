@@ -1,47 +1,159 @@
 from __future__ import annotations
 
+import codecs
+import hashlib
+import threading
 import traceback
 from abc import abstractmethod
+from collections import OrderedDict
 from collections.abc import Callable
-from typing import TYPE_CHECKING, override
+from typing import override
 
 import rich
 
 from . import results as R
-
-if TYPE_CHECKING:
-    from .matcher import SequenceMatcher
+from .matcher import SequenceMatcher, highlight_matched
 
 console = rich.get_console()
 console._highlight = False
 
-type CheckerResult = R.AC | R.WA | R.PE | R.INT
+
+def _digest(text: str | None) -> bytes | None:
+    return None if text is None else hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+type CheckerResult = R.AC | R.WA | R.PE | R.INT | R.PD | R.PC
+
+
+class _AnswerCache[V]:
+    """Values built from answers, e.g. compiled matchers, keeping the `maxsize` most recently used
+
+    Keyed by case index and answer digest, so that answer texts are not kept alive.
+    """
+
+    def __init__(self, build: Callable[[str], V], maxsize: int = 64) -> None:
+        self.build = build
+        self.maxsize = maxsize
+        self._values: OrderedDict[tuple[int, bytes | None], V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, index: int, ans: str) -> V:
+        key = (index, _digest(ans))
+        with self._lock:
+            if (value := self._values.get(key)) is not None:
+                self._values.move_to_end(key)
+                return value
+        value = self.build(ans)
+        with self._lock:
+            self._values[key] = value
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+        return value
+
+
+# 行尾忽略的空白
+_BLANKS = " \t\r"
+# 报告差异时，差异位置前后各显示的字符数
+_CONTEXT = 20
+
+
+class StreamMonitor:
+    """Incremental check of the output of a test case while the program runs"""
+
+    @abstractmethod
+    def feed(self, data: bytes) -> str | None:
+        """Consume the next chunk of stdout
+
+        Returns:
+            where and how the output diverges, as soon as it can no longer be accepted, in which case
+            the program is killed and the case judged WA
+        """
+
+    @abstractmethod
+    def finish(self) -> CheckerResult | None:
+        """Verdict once the whole output has been fed, or None to leave it to `Checker.check`"""
 
 
 class Checker:
+    # 非交互时需要人工判定的用例记为 PD，留待之后复查
+    interactive: bool = True
+
     def __init__(self) -> None:
         pass
 
     @abstractmethod
     def check(self, index: int, stdin: str, stdout: str, ans: str) -> CheckerResult: ...
 
+    @property
+    def needs_stdin(self) -> bool:
+        """Whether `check` reads `stdin`. If not, an empty string is passed to avoid loading input files."""
+        return True
+
+    @property
+    def monitors_output(self) -> bool:
+        """Whether `monitor` may return a monitor. If not, answers are not read to build monitors."""
+        return type(self).monitor is not Checker.monitor
+
+    def monitor(self, index: int, ans: str) -> StreamMonitor | None:
+        """Monitor checking the output of a case as it is produced, or None if `check` has to see all of it.
+        When the whole output has been fed to the monitor, its verdict replaces `check`."""
+        return None
+
+    def signature(self) -> str:
+        """Configuration affecting the verdicts"""
+        return type(self).__qualname__
+
+    def reserve(self, cases: int) -> None:
+        """Keep the values built from the answers of at least `cases` test cases
+
+        Every submission walks the cases in order, so a smaller cache would evict each answer just before
+        it is needed again.
+        """
+        for value in vars(self).values():
+            if isinstance(value, _AnswerCache):
+                value.maxsize = max(value.maxsize, cases)
+
 
 class SequenceMatchChecker(Checker):
     def __init__(
         self,
         matcher_cls: type[SequenceMatcher],
         default_judge: bool = False,
+        partial_credit: bool = False,
         **matcher_args,
     ) -> None:
+        """
+        Args:
+            matcher_cls: matcher constructed with the answer and `matcher_args`
+            default_judge: verdict of an empty manual judgment
+            partial_credit: instead of asking for a manual judgment, give partial credit (PC)
+                by the fraction of the answer matched, e.g. with `AlignmentMatcher`
+        """
         self.matcher_cls = matcher_cls
         self.matcher_args = matcher_args
         self.default_judge = default_judge
+        self.partial_credit = partial_credit
         self.fallback_fun: Callable[[str, str, str], CheckerResult | None] | None = None
+        # 答案在一次运行中不变，匹配器只编译一次
+        self._matchers = _AnswerCache(self._compile)
+
+    def matcher(self, index: int, ans: str) -> SequenceMatcher:
+        """Matcher compiled for the answer of a case, memoized"""
+        return self._matchers.get(index, ans)[0]
+
+    def _compile(self, ans: str) -> tuple[SequenceMatcher, bytes | None]:
+        matcher = self.matcher_cls(ans, **self.matcher_args)
+        return matcher, _digest(matcher.canonical(ans))
 
     @override
     def check(self, index: int, stdin: str, stdout: str, ans: str) -> CheckerResult:
-        matcher = self.matcher_cls(ans, **self.matcher_args)
+        matcher, digest = self._matchers.get(index, ans)
         try:
+            # 快速路径：规范化后与答案完全一致
+            if digest is not None and _digest(matcher.canonical(stdout)) == digest:
+                console.print("stdout: ", style="blue")
+                console.print(highlight_matched(stdout, [(0, len(stdout))]))
+                return R.AC()
             m = matcher(stdout)
             if m.ok:
                 console.print("stdout: ", style="blue")
@@ -55,14 +167,157 @@ class SequenceMatchChecker(Checker):
             console.print(f"Matched: {len(m.matched)}/{matcher.num_patterns}", style="red")
             console.print("stdout: ", style="blue")
             console.print(m.match_str, highlight=False, markup=False)
+            if self.partial_credit:
+                return R.PC(m.score) if m.score > 0 else R.WA("Nothing matched")
+            if not self.interactive:
+                return R.PD()
             console.print(f"Manual judge #{index} (yes=AC): ", end="", style="cyan")
-            judge = console.input().lower()
-            if judge in ("int", "i"):
-                return R.INT()
-            if self.default_judge:
-                j = judge not in ("no", "n", "f")
-            else:
-                j = judge in ("yes", "y", "t")
-            return R.AC() if j else R.WA()
+            return self.judge(console.input())
         except Exception as _:
             return R.PE(traceback.format_exc())
+
+    @property
+    @override
+    def needs_stdin(self) -> bool:
+        return self.fallback_fun is not None
+
+    @override
+    def signature(self) -> str:
+        fallback = self.fallback_fun.__qualname__ if self.fallback_fun else None
+        return (
+            f"{type(self).__qualname__}({self.matcher_cls.__qualname__}, {sorted(self.matcher_args.items())}, "
+            f"default_judge={self.default_judge}, partial_credit={self.partial_credit}, fallback={fallback})"
+        )
+
+    def judge(self, answer: str) -> R.AC | R.WA | R.INT:
+        """Interpret a manual judgment"""
+        answer = answer.lower()
+        if answer in ("int", "i"):
+            return R.INT()
+        if self.default_judge:
+            j = answer not in ("no", "n", "f")
+        else:
+            j = answer in ("yes", "y", "t")
+        return R.AC() if j else R.WA()
+
+
+class _ExactMonitor(StreamMonitor):
+    def __init__(self, expected: list[str]) -> None:
+        self.expected = expected
+        self.line = 0
+        self.col = 0
+        # 当前行中 col 之前的若干字符，用于报告
+        self.recent = ""
+        # 按 UTF-8 解码后比较；不是 UTF-8 时由 check 在 auto_decode 之后判定
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.deferred = False
+
+    def _expected(self) -> str:
+        return self.expected[self.line] if self.line < len(self.expected) else ""
+
+    def _diverge(self, col: int, got: str) -> str:
+        """Report a divergence at `col`, with `got` the current line from `col - len(self.recent)` on"""
+        start = max(col - _CONTEXT, 0)
+        got = got[start - (self.col - len(self.recent)) :][: col + _CONTEXT - start]
+        where = f"Line {self.line + 1}, column {col + 1}"
+        if self.line >= len(self.expected):
+            return f"{where}: unexpected output {got!r}"
+        return f"{where}: expected {self._expected()[start : col + _CONTEXT]!r}, got {got!r}"
+
+    def _extend(self, data: str) -> str | None:
+        """Check a part of the current line: characters within the expected line must match, blanks may follow"""
+        start = self.col
+        exp = self._expected()
+        msg = None
+        if start < len(exp):
+            seg = data[: len(exp) - start]
+            if seg != exp[start : start + len(seg)]:
+                col = start + next(i for i, (a, b) in enumerate(zip(seg, exp[start:], strict=False)) if a != b)
+                msg = self._diverge(col, self.recent + data)
+        tail = data[max(len(exp) - start, 0) :]
+        if msg is None and tail.strip(_BLANKS):
+            col = max(start, len(exp)) + len(tail) - len(tail.lstrip(_BLANKS))
+            msg = self._diverge(col, self.recent + data)
+        self.col += len(data)
+        self.recent = (self.recent + data[-_CONTEXT:])[-_CONTEXT:]
+        return msg
+
+    def _end_line(self) -> str | None:
+        if self.col < len(self._expected()):
+            return self._diverge(self.col, self.recent + "\n")
+        self.line += 1
+        self.col = 0
+        self.recent = ""
+        return None
+
+    def feed_text(self, text: str) -> str | None:
+        *lines, rest = text.split("\n")
+        for line in lines:
+            if msg := self._extend(line) or self._end_line():
+                return msg
+        return self._extend(rest)
+
+    @override
+    def feed(self, data: bytes) -> str | None:
+        if self.deferred:
+            return None
+        try:
+            text = self.decoder.decode(data)
+        except UnicodeDecodeError:
+            self.deferred = True
+            return None
+        return self.feed_text(text)
+
+    @override
+    def finish(self) -> CheckerResult | None:
+        if self.deferred:
+            return None
+        try:
+            # 末尾不完整的字符
+            self.decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return None
+        return self.result()
+
+    def result(self) -> CheckerResult:
+        """Verdict of the text fed so far, as the whole output"""
+        if self.col and (msg := self._end_line()):
+            return R.WA(msg)
+        if self.line < len(self.expected):
+            return R.WA(f"Line {self.line + 1}: missing, expected {self.expected[self.line][: 2 * _CONTEXT]!r}")
+        return R.AC()
+
+
+class ExactMatchChecker(Checker):
+    """Compare the output with the answer line by line, ignoring trailing blanks and blank lines at the end
+
+    The output is checked while the program runs; the program is killed at the first difference.
+    Output that is not valid UTF-8 is only checked once complete, after decoding it as other checkers do.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._expected = _AnswerCache(self._lines)
+
+    @override
+    def check(self, index: int, stdin: str, stdout: str, ans: str) -> CheckerResult:
+        monitor = self.monitor(index, ans)
+        if msg := monitor.feed_text(stdout):
+            return R.WA(msg)
+        return monitor.result()
+
+    @property
+    @override
+    def needs_stdin(self) -> bool:
+        return False
+
+    @override
+    def monitor(self, index: int, ans: str) -> _ExactMonitor:
+        return _ExactMonitor(self._expected.get(index, ans))
+
+    @staticmethod
+    def _lines(ans: str) -> list[str]:
+        expected = [line.rstrip(_BLANKS) for line in ans.split("\n")]
+        while expected and not expected[-1]:
+            expected.pop()
+        return expected
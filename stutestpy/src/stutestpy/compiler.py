@@ -1,28 +1,87 @@
 from __future__ import annotations
 
+import os
+import re
 import subprocess
-import sys
+import tempfile
+import time
 from abc import abstractmethod
 from pathlib import Path
-from typing import override
+from typing import TYPE_CHECKING, override
 
 import rich
 from more_itertools import flatten
 from result import Err, Ok, Result
 
 from . import results as R
+from .fingerprint import compile_fingerprint
+from .trace import tracer
+from .utils import auto_decode
+
+if TYPE_CHECKING:
+    from .cache import CompileCache
+    from .pch import PrecompiledHeader
 
 console = rich.get_console()
 
+type StrPath = str | Path
+
+# 无插桩的优化构建，用于分级评测的第一级
+FAST_ARGS = ["clang++", "-std=c++23", "-O2"]
+# 共享库构建，供 HarnessRunner 在进程内加载（无法使用 sanitizer）
+SHARED_ARGS = [*FAST_ARGS, "-shared", "-fPIC"]
+
+# 编译器拒绝 PCH 时的诊断（GCC、Clang），出现时不用 PCH 重新编译
+_PCH_REJECTED = re.compile(
+    r"one or more PCH files were found, but they were invalid|not using precompiled header|bad magic"
+    r"|created by a different GCC executable|: not a PCH file"
+    r"|PCH file .*(?:was built with|not usable|was compiled for)|(?:en|dis)abled in (?:PCH|precompiled) file"
+    r"|has been modified since the precompiled header|malformed or corrupted (?:AST|precompiled) file"
+    r"|is not a valid precompiled PCH file"
+)
+
 
 class Compiler:
     @abstractmethod
     def compile(self, source: list[Path], dest: Path, *, includes: list[Path] | None = None) -> Result[Path, R.CE]: ...
 
+    def compile_object(
+        self, source: Path, obj_dir: Path, *, includes: list[Path] | None = None
+    ) -> Result[Path, R.CE] | None:
+        """Compile a shared source into an object file that can be linked by `compile`
+
+        Returns:
+            None if not supported, in which case the source is compiled along with the others
+        """
+        return None
+
+    def check_syntax(self, sources: list[Path], *, includes: list[Path] | None = None) -> Result[None, R.CE] | None:
+        """Check sources for compilation errors without generating code. Diagnostics are not printed.
+
+        Returns:
+            None if not supported
+        """
+        return None
+
+    def signature(self) -> str:
+        """Configuration affecting the compiled program"""
+        return type(self).__qualname__
+
+    def summary(self) -> str | None:
+        return None
+
 
 class LocalCompiler(Compiler):
-    def __init__(self, args: list[str] | None = None) -> None:
+    def __init__(
+        self,
+        args: list[str] | None = None,
+        *,
+        cache: CompileCache | None = None,
+        pch: PrecompiledHeader | None = None,
+    ) -> None:
         super().__init__()
+        self.cache = cache
+        self.pch = pch
         self.args = args or [
             "clang++",
             "-std=c++23",
@@ -36,19 +95,94 @@ class LocalCompiler(Compiler):
             "-fno-omit-frame-pointer",
         ]
 
+    def _run(self, argv: list[StrPath]) -> tuple[int, str]:
+        r = subprocess.run(argv, capture_output=True)
+        return r.returncode, auto_decode(r.stdout + r.stderr)
+
+    def _invoke(
+        self, sources: list[Path], out: StrPath, *, includes: list[Path] | None, extra: list[str]
+    ) -> tuple[bool, str]:
+        tail: list[StrPath] = [
+            *extra,
+            *sources,
+            *(flatten(("-I", str(i)) for i in includes) if includes else []),
+            "-o",
+            out,
+        ]
+        flags = self.pch.flags(self.args, sources, includes) if self.pch else []
+        code, diagnostics = self._run([*self.args, *flags, *tail])
+        if self.pch and flags:
+            if code != 0 and _PCH_REJECTED.search(diagnostics):
+                # PCH 不兼容时退回普通编译
+                self.pch.record_fallback()
+                code, diagnostics = self._run([*self.args, *tail])
+            elif code == 0 and "invalid-pch" not in diagnostics:
+                self.pch.record_use(flags)
+        # 经由 console 输出，以便并行测试时捕获
+        if diagnostics:
+            console.out(diagnostics, end="", highlight=False)
+        return code == 0, diagnostics
+
     @override
     def compile(self, sources: list[Path], dest: Path, *, includes: list[Path] | None = None) -> Result[Path, R.CE]:
+        with tracer.span("compile", "compiler", dest=str(dest)):
+            return self._compile(sources, dest, includes)
+
+    def _compile(self, sources: list[Path], dest: Path, includes: list[Path] | None) -> Result[Path, R.CE]:
+        key = None
+        if self.cache:
+            key = compile_fingerprint(sources, includes, self.args)
+            if self.cache.get(key, dest):
+                tracer.add("cache hit", "compiler", time.monotonic_ns(), 0, dest=str(dest))
+                console.print(f"Compile (cached): {sources}", style="yellow")
+                return Ok(Path(dest))
+
         console.print(f"Compile: {sources}", style="yellow")
-        r = subprocess.run(
-            [
-                *self.args,
-                *sources,
-                *(flatten(("-I", i) for i in includes) if includes else []),
-                "-o",
-                dest,
-            ],
-            stdout=sys.stdout,
-            stderr=sys.stderr,
-            # capture_output=True,
-        )
-        return Err(R.CE()) if r.returncode != 0 else Ok(Path(dest))
+        ok, diagnostics = self._invoke(sources, dest, includes=includes, extra=[])
+        if not ok:
+            return Err(R.CE(details=diagnostics))
+        if self.cache and key:
+            self.cache.put(key, dest)
+        return Ok(Path(dest))
+
+    @override
+    def compile_object(
+        self, source: Path, obj_dir: Path, *, includes: list[Path] | None = None
+    ) -> Result[Path, R.CE] | None:
+        # 以内容哈希命名，不同提交、不同进程间均可复用
+        obj = obj_dir / f"{compile_fingerprint([source], includes, [*self.args, '-c'])}.o"
+        if obj.exists():
+            return Ok(obj)
+
+        console.print(f"Compile object: {source}", style="yellow")
+        obj_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".o", dir=obj_dir, prefix=".tmp-")
+        os.close(fd)
+        with tracer.span("compile object", "compiler", source=str(source)):
+            ok, diagnostics = self._invoke([source], tmp, includes=includes, extra=["-c"])
+        if not ok:
+            Path(tmp).unlink(missing_ok=True)
+            return Err(R.CE(details=diagnostics))
+        os.replace(tmp, obj)
+        return Ok(obj)
+
+    @override
+    def check_syntax(self, sources: list[Path], *, includes: list[Path] | None = None) -> Result[None, R.CE] | None:
+        argv: list[StrPath] = [
+            *self.args,
+            "-fsyntax-only",
+            *sources,
+            *(flatten(("-I", str(i)) for i in includes) if includes else []),
+        ]
+        with tracer.span("check syntax", "compiler", sources=[str(f) for f in sources]):
+            code, diagnostics = self._run(argv)
+        return Ok(None) if code == 0 else Err(R.CE(details=diagnostics))
+
+    @override
+    def signature(self) -> str:
+        return "\0".join(self.args)
+
+    @override
+    def summary(self) -> str | None:
+        lines = [str(x) for x in (self.cache, self.pch) if x]
+        return "\n".join(lines) if lines else None
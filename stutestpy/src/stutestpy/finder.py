@@ -2,11 +2,17 @@ from abc import abstractmethod
 from pathlib import Path
 from typing import override
 
+from .index import SubmissionIndex
+
 
 class SubmissionFinder:
     @abstractmethod
     def find_submission(self, folder: Path) -> Path | None: ...
 
+    def find_in(self, index: SubmissionIndex) -> Path | None:
+        """Find the submission in an index of the folder, which avoids traversing it again"""
+        return self.find_submission(index.root)
+
 
 class FindSubmissionByKeywords(SubmissionFinder):
     def __init__(self, keywords: list[str]) -> None:
@@ -14,10 +20,15 @@ class FindSubmissionByKeywords(SubmissionFinder):
 
     @override
     def find_submission(self, folder: Path) -> Path | None:
+        return self.find_in(SubmissionIndex.scan(folder, (".cpp",)))
+
+    @override
+    def find_in(self, index: SubmissionIndex) -> Path | None:
+        files = index.with_suffix(".cpp")
         # 按照关键词顺序匹配
         for k in self.keywords:
-            for f in folder.glob("**/*.cpp"):
-                if f.is_file() and f.suffix == ".cpp" and k in f.name.lower():
+            for f in files:
+                if k in f.name.lower():
                     return f
         return None
 
@@ -31,3 +42,7 @@ class FindHeader(SubmissionFinder):
         # 严格匹配头文件名
         f = folder / self.header
         return f if f.is_file() else None
+
+    @override
+    def find_in(self, index: SubmissionIndex) -> Path | None:
+        return index.get(self.header)
@@ -0,0 +1,70 @@
+import hashlib
+import re
+from collections.abc import Iterable
+from pathlib import Path
+
+SOURCE_SUFFIXES = (".c", ".cc", ".cpp", ".cxx")
+INCLUDE_PATTERN = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\n]+)[>"]', re.M)
+
+
+def _resolve_include(name: str, quoted: bool, current: Path, includes: list[Path]) -> Path | None:
+    # 引号形式先在当前文件所在目录查找，之后与尖括号形式相同
+    dirs = [current.parent, *includes] if quoted else includes
+    for d in dirs:
+        if (f := d / name).is_file():
+            return f
+    return None
+
+
+def local_headers(sources: Iterable[Path], includes: list[Path] | None = None) -> list[Path]:
+    """Collect local headers transitively included by sources
+
+    Only headers found next to the including file or under `includes` are considered,
+    system headers are ignored.
+
+    Returns:
+        list[Path]: headers in the order of first inclusion
+    """
+    includes = includes or []
+    seen: set[Path] = set()
+    result: list[Path] = []
+    stack = list(reversed(list(sources)))
+    while stack:
+        f = stack.pop()
+        try:
+            text = f.read_bytes()
+        except OSError:
+            continue
+        found: list[Path] = []
+        for m in INCLUDE_PATTERN.finditer(text):
+            name = m[2].decode(errors="replace").strip()
+            header = _resolve_include(name, m[1] == b'"', f, includes)
+            if header is None:
+                continue
+            key = header.resolve()
+            if key not in seen:
+                seen.add(key)
+                result.append(header)
+                found.append(header)
+        stack.extend(reversed(found))
+    return result
+
+
+def hash_files(files: Iterable[Path], h: "hashlib._Hash | None" = None) -> str:
+    h = h or hashlib.sha256()
+    for f in files:
+        data = f.read_bytes()
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def compile_fingerprint(sources: list[Path], includes: list[Path] | None, argv: Iterable[str]) -> str:
+    """Content hash of a compilation: compiler argv, source bytes and local headers"""
+    h = hashlib.sha256()
+    for a in argv:
+        h.update(str(a).encode())
+        h.update(b"\0")
+    h.update(len(sources).to_bytes(8, "little"))
+    headers = local_headers([f for f in sources if f.suffix in SOURCE_SUFFIXES], includes)
+    return hash_files([*sources, *headers], h)
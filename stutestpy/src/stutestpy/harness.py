@@ -0,0 +1,206 @@
+import ctypes
+import multiprocessing
+import os
+import resource
+import select
+import signal
+import sys
+import tempfile
+import time
+from collections.abc import Sequence
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, override
+
+from result import Err, Ok
+
+from . import results as R
+from .runner import _STDERR_KEEP, Execution, RunResult, Stdin, TestRunner
+from .trace import tracer
+from .utils import auto_decode, trunc_lines
+
+if TYPE_CHECKING:
+    from .checker import StreamMonitor
+
+# 工作进程发回的单个用例结果：
+# 退出状态、标准输出、标准错误、开始时间、墙钟时间、rusage、是否超时
+type _Report = tuple[int, bytes, bytes, float, float, Any, bool]
+
+
+class HarnessRunner(TestRunner):
+    """Run test cases by calling an entry point of a shared library, without executing a program per case
+
+    Build submissions as shared objects, e.g. with `LocalCompiler(SHARED_ARGS)`. For each `run_many` call,
+    a forked worker loads the library once, then forks a child per case which redirects its standard streams,
+    calls `int entry(void)` and exits as the program would have returned from `main`. Children are isolated:
+    a crash is a runtime error, a hang is killed at the time limit, and global state is fresh in every case.
+    Limits and verdicts are the same as `TestRunner`'s; cases run one at a time, and monitors are fed
+    the output after each case. POSIX only.
+
+    AddressSanitizer cannot be loaded into an uninstrumented process, so libraries should be built
+    without sanitizers.
+    """
+
+    def __init__(
+        self, time_limit: float, output_trunc: int | None = 100, *, entry: str = "main", **kwargs: Any
+    ) -> None:
+        """
+        Args:
+            entry: exported function called for each case, `main` or an `extern "C"` function without parameters
+            kwargs: see `TestRunner`
+        """
+        super().__init__(time_limit, output_trunc, **kwargs)
+        self.entry = entry
+
+    @override
+    def signature(self) -> str:
+        return f"{super().signature()}\0harness:{self.entry}"
+
+    @override
+    def run_many(
+        self, exe: Path, stdins: Sequence[Stdin], monitors: Sequence["StreamMonitor | None"] | None = None
+    ) -> list[Execution]:
+        # 在工作进程中加载提交者的代码，评测进程不受其影响
+        ctx = multiprocessing.get_context("fork")
+        recv, send = ctx.Pipe(duplex=False)
+        worker = ctx.Process(target=self._serve, args=(exe, stdins, send), daemon=True)
+        worker.start()
+        send.close()
+
+        executions: list[Execution] = []
+        try:
+            while len(executions) < len(stdins):
+                # 加载库时的静态构造函数也可能卡住
+                if not recv.poll(self.time_limit + 10):
+                    worker.kill()
+                    break
+                try:
+                    report: _Report | str = recv.recv()
+                except EOFError:
+                    break
+                if isinstance(report, str):
+                    # 无法加载库或找不到入口
+                    executions += [Execution(Err(R.RE(report)), 0.0) for _ in range(len(executions), len(stdins))]
+                    break
+                i = len(executions)
+                executions.append(self._execution(exe, i, report, monitors[i] if monitors else None))
+        finally:
+            recv.close()
+            worker.join()
+
+        for _ in range(len(executions), len(stdins)):
+            executions.append(Execution(Err(R.UKE(f"Harness worker exited with code {worker.exitcode}")), 0.0))
+        self._symbolize(executions)
+        return executions
+
+    def _execution(self, exe: Path, index: int, report: _Report, monitor: "StreamMonitor | None") -> Execution:
+        status, stdout, stderr, start, wall_time, rusage, timed_out = report
+        cpu_time = rusage.ru_utime + rusage.ru_stime
+        memory = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+        code = os.waitstatus_to_exitcode(status)
+        flooded = ""
+        if code == -signal.SIGXFSZ or len(stdout) + len(stderr) > self.output_limit:
+            flooded = f"Output exceeded {self.output_limit} bytes"
+
+        result: RunResult
+        match self._verdict(exe, code, stderr, cpu_time, timed_out, flooded):
+            case Ok() if monitor and (msg := monitor.feed(stdout)):
+                result = Err(R.WA(msg))
+            case Ok():
+                text = auto_decode(stdout)
+                if self.line_limit is not None and text.count("\n") > self.line_limit:
+                    result = Err(R.OLE(f"Output exceeded {self.line_limit} lines"))
+                else:
+                    result = Ok(text if self.output_trunc is None else trunc_lines(text, self.output_trunc))
+            case Err() as e:
+                result = e
+        tracer.add("case", "runner", int(start * 1e9), int(wall_time * 1e9), case=index, harness=True)
+        return Execution(result, wall_time, cpu_time, memory, streamed=monitor is not None and result.is_ok())
+
+    def _serve(self, exe: Path, stdins: Sequence[Stdin], conn: Connection) -> None:
+        """Worker process: load the library, then run each case in a forked child"""
+        # 静态构造函数的输出不应出现在评测终端
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        try:
+            lib = ctypes.CDLL(str(exe.resolve()))
+            entry = getattr(lib, self.entry)
+        except (OSError, AttributeError) as e:
+            conn.send(f"Failed to load entry point '{self.entry}' of '{exe}': {e}")
+            return
+        entry.restype = ctypes.c_int
+        entry.argtypes = []
+        libc = ctypes.CDLL(None)
+        c_stdin = ctypes.c_void_p.in_dll(libc, "__stdinp" if sys.platform == "darwin" else "stdin")
+        purge = getattr(libc, "fpurge" if sys.platform == "darwin" else "__fpurge", None)
+
+        limits = self._limits()
+        # 输出写入临时文件，用文件大小限制替代管道上的计数
+        fsize = min(x for x in (self.output_limit, self.file_size_limit) if x is not None)
+        limits.append((resource.RLIMIT_FSIZE, (fsize, fsize)))
+        for stdin in stdins:
+            with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+                source: IO[bytes]
+                if isinstance(stdin, str):
+                    source = tempfile.TemporaryFile()
+                    source.write(stdin.encode())
+                    source.seek(0)
+                else:
+                    source = open(stdin or os.devnull, "rb")
+                with source:
+                    start = time.monotonic()
+                    pid = os.fork()
+                    if pid == 0:
+                        try:
+                            os.dup2(source.fileno(), 0)
+                            os.dup2(out.fileno(), 1)
+                            os.dup2(err.fileno(), 2)
+                            # 恢复 Python 忽略的信号，使超出文件大小限制时以 SIGXFSZ 终止（判为 OLE）
+                            signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+                            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+                            # 丢弃从评测进程继承的 C 标准输入状态（缓冲区与 EOF 标志）
+                            if purge is not None:
+                                purge(c_stdin)
+                            libc.clearerr(c_stdin)
+                            for res, value in limits:
+                                resource.setrlimit(res, value)
+                            code = entry()
+                        except BaseException:
+                            os._exit(120)
+                        # 与从 main 返回相同：执行 atexit 与静态析构，刷新 C/C++ 输出缓冲
+                        libc.exit(code)
+                    status, rusage, timed_out = self._wait(pid, start + self.time_limit)
+                    wall_time = time.monotonic() - start
+
+                out.seek(0)
+                stdout = out.read(self.output_limit + 1)
+                err.seek(0)
+                stderr = err.read(_STDERR_KEEP)
+            conn.send((status, stdout, stderr, start, wall_time, rusage, timed_out))
+        conn.close()
+
+    @staticmethod
+    def _wait(pid: int, deadline: float) -> tuple[int, Any, bool]:
+        """Wait for the child until the deadline, then kill it"""
+        timed_out = False
+        if hasattr(os, "pidfd_open"):
+            fd = os.pidfd_open(pid)
+            try:
+                ready, _, _ = select.select([fd], [], [], max(deadline - time.monotonic(), 0.0))
+            finally:
+                os.close(fd)
+            timed_out = not ready
+        else:
+            # 不支持 pidfd 时轮询
+            while (waited := os.wait4(pid, os.WNOHANG))[0] == 0:
+                if time.monotonic() >= deadline:
+                    timed_out = True
+                    break
+                time.sleep(0.001)
+            else:
+                return waited[1], waited[2], False
+        if timed_out:
+            os.kill(pid, signal.SIGKILL)
+        _, status, rusage = os.wait4(pid, 0)
+        return status, rusage, timed_out
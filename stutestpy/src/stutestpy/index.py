@@ -0,0 +1,64 @@
+import os
+from collections.abc import Collection
+from pathlib import Path
+
+INDEX_SUFFIXES = (".c", ".cc", ".cpp", ".cxx", ".h", ".hh", ".hpp", ".hxx")
+
+
+class SubmissionIndex:
+    """Files of a submission folder, listed with a single traversal
+
+    Files are kept in the order of `Path.glob("**/*")`: those of a folder first, then its sub-folders
+    depth first. Symbolic links to folders are not followed.
+    """
+
+    def __init__(self, root: Path, files: list[Path], suffixes: Collection[str] | None = None) -> None:
+        """
+        Args:
+            root: indexed folder
+            files: files under `root`
+            suffixes: suffixes of the files kept, or None if all files are kept
+        """
+        self.root = root
+        self.files = files
+        self.suffixes = suffixes
+        self._relative = {f.relative_to(root).as_posix(): f for f in files}
+
+    @classmethod
+    def scan(cls, root: Path, suffixes: Collection[str] | None = INDEX_SUFFIXES) -> "SubmissionIndex":
+        files: list[Path] = []
+        # 栈中为待访问的文件夹，逆序入栈以保持先序
+        stack = [root]
+        while stack:
+            folder = stack.pop()
+            subdirs: list[Path] = []
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(Path(entry.path))
+                        elif suffixes is None or os.path.splitext(entry.name)[1] in suffixes:
+                            files.append(Path(entry.path))
+            except OSError:
+                continue
+            stack.extend(reversed(subdirs))
+        return cls(root, files, suffixes)
+
+    def with_suffix(self, suffix: str) -> list[Path]:
+        """Files with the suffix, in traversal order"""
+        return [f for f in self.files if f.suffix == suffix]
+
+    def get(self, name: str) -> Path | None:
+        """The file at the path relative to the root, if it exists"""
+        if self.suffixes is not None and Path(name).suffix not in self.suffixes:
+            # 未被索引的文件直接查询
+            f = self.root / name
+            return f if f.is_file() else None
+        return self._relative.get(Path(name).as_posix())
+
+    def add(self, file: Path) -> None:
+        """Record a file created under the root"""
+        rel = file.relative_to(self.root).as_posix()
+        if rel not in self._relative:
+            self.files.append(file)
+            self._relative[rel] = file
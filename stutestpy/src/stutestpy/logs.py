@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from types import TracebackType
+
+from dataclasses_json import DataClassJsonMixin
+
+if os.name == "posix":
+    import fcntl
+
+
+@dataclass
+class RerunLog(DataClassJsonMixin):
+    status: str
+    message: str
+    output: str | None = None
+
+
+@dataclass
+class TestCaseLog(DataClassJsonMixin):
+    output: str | None
+    status: str
+    message: str
+    time: float | None = None
+    cpu_time: float | None = None
+    memory: int | None = None
+    fingerprint: str = ""
+    score: float | None = None
+    """Fraction of the answer matched, for partially correct cases"""
+    sanitized: RerunLog | None = None
+    """Rerun with the sanitizer build, for cases failed by the fast build"""
+
+
+@dataclass
+class TestLog(DataClassJsonMixin):
+    submitter: str
+    status: str = ""
+    result: list[TestCaseLog] | None = None
+    message: str = ""
+    passed: int = 0
+    pending: int = 0
+    fingerprint: str = ""
+    score: float = 0.0
+    """Passed cases plus the scores of partially correct ones"""
+    details: str = ""
+    """Compiler diagnostics of a compilation error"""
+
+
+def _dumps(log: TestLog) -> str:
+    return json.dumps(log.to_dict(), ensure_ascii=False) + "\n"
+
+
+class LogWriter:
+    """Append-only JSON Lines log with one record per submission
+
+    Each record is written with a single `write` under an exclusive file lock and synced to disk,
+    so several processes may append to the same log.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, log: TestLog) -> None:
+        data = _dumps(log).encode()
+        if os.name == "posix":
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view) :]
+            os.fsync(self._fd)
+        finally:
+            if os.name == "posix":
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+    def __enter__(self) -> "LogWriter":
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        self.close()
+
+
+def load_logs(path: Path) -> list[TestLog]:
+    """Load logs written by `LogWriter` or `save_logs`
+
+    The legacy format, a single JSON array, is also accepted. When a submitter appears more than once,
+    the last record wins. A partially written last line is ignored.
+    """
+    text = path.read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        return [TestLog.from_dict(d) for d in json.loads(text)]
+
+    logs: dict[str, TestLog] = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            log = TestLog.from_dict(json.loads(line))
+        except (ValueError, KeyError):
+            continue
+        logs[log.submitter] = log
+    return list(logs.values())
+
+
+def save_logs(path: Path, logs: list[TestLog]) -> None:
+    """Replace the log file with the given records"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.writelines(_dumps(log) for log in logs)
+    os.replace(tmp, path)
@@ -1,5 +1,7 @@
 import re
 from abc import abstractmethod
+from bisect import bisect_left, bisect_right
+from collections.abc import Sized
 from dataclasses import dataclass
 from typing import override
 
@@ -9,9 +11,94 @@ from .utils import colored
 
 
 def highlight_matched(s: str, matched: list[tuple[int, int]]) -> str:
-    for l, r in reversed(matched):
-        s = s[:l] + colored(s[l:r], fg=Fore.CYAN) + s[r:]
-    return s
+    """Color the matched spans, which must be sorted and not overlapping"""
+    parts: list[str] = []
+    last = 0
+    for l, r in matched:
+        parts.append(s[last:l])
+        parts.append(colored(s[l:r], fg=Fore.CYAN))
+        last = r
+    parts.append(s[last:])
+    return "".join(parts)
+
+
+class _SequenceScanner:
+    """Find each pattern at its first occurrence after the previous match, skipping those not found
+
+    The result of each distinct pattern is cached, and stays valid as the position only moves forward,
+    so repeated patterns do not scan the output again. Before running a regex, its longest literal part
+    is looked up with `str.find`, which rejects most patterns absent from the output much faster.
+    """
+
+    def __init__(self, patterns: list[re.Pattern[str]], literals: list[str]) -> None:
+        self.patterns = patterns
+        # 不区分大小写时，只对 ASCII 字面量在小写输出中查找
+        self.literals = [
+            (lit.lower() if p.flags & re.I else lit) if lit and (lit.isascii() or not p.flags & re.I) else ""
+            for p, lit in zip(patterns, literals, strict=True)
+        ]
+
+    def scan(self, output: str) -> list[tuple[int, int] | None]:
+        lowered = output.lower() if output.isascii() else None
+        # 模式 -> (查找起点, 结果)，结果对之后的起点仍然有效
+        found: dict[re.Pattern[str], tuple[int, tuple[int, int] | None]] = {}
+        located: dict[tuple[str, bool], tuple[int, int]] = {}
+        spans: list[tuple[int, int] | None] = []
+        pos = 0
+        for pat, lit in zip(self.patterns, self.literals, strict=True):
+            cached = found.get(pat)
+            if cached is None or cached[0] > pos or (cached[1] is not None and cached[1][0] < pos):
+                span = None
+                if self._may_occur(output, lowered, pat, lit, pos, located):
+                    m = pat.search(output, pos)
+                    span = m.span() if m else None
+                cached = found[pat] = (pos, span)
+            spans.append(span := cached[1])
+            if span:
+                pos = span[1]
+        return spans
+
+    @staticmethod
+    def _may_occur(
+        output: str,
+        lowered: str | None,
+        pat: re.Pattern[str],
+        lit: str,
+        pos: int,
+        located: dict[tuple[str, bool], tuple[int, int]],
+    ) -> bool:
+        if not lit:
+            return True
+        ignore_case = bool(pat.flags & re.I)
+        if ignore_case and lowered is None:
+            return True
+        key = (lit, ignore_case)
+        start, at = located.get(key, (-1, -1))
+        if start < 0 or start > pos or 0 <= at < pos:
+            at = (lowered if ignore_case else output).find(lit, pos)  # type: ignore[union-attr]
+            located[key] = (pos, at)
+        return at >= 0
+
+
+def _longest_literal(text: str, ignore_spaces: bool = True) -> str:
+    """Longest part of the text that must appear verbatim in a match"""
+    return max(re.split(" +", text), key=len) if ignore_spaces else text
+
+
+def _join_stripped(parts: list[str]) -> str | None:
+    """Join non-empty parts, or None if any of them starts or ends with whitespace.
+
+    A pattern ending with `\\s*` consumes the whitespace that follows greedily, which the next pattern
+    may need if it starts with a whitespace other than space.
+    """
+    parts = [p for p in parts if p]
+    if any(p[0].isspace() or p[-1].isspace() for p in parts):
+        return None
+    return "\n".join(parts)
+
+
+def _score(matched: Sized, patterns: Sized) -> float:
+    return len(matched) / len(patterns) if patterns else 1.0
 
 
 @dataclass
@@ -19,6 +106,8 @@ class Match:
     ok: bool
     matched: list[tuple[int, int]]
     match_str: str
+    score: float = 0.0
+    """Fraction of the patterns matched"""
 
 
 class SequenceMatcher:
@@ -32,6 +121,14 @@ class SequenceMatcher:
     @abstractmethod
     def num_patterns(self) -> int: ...
 
+    def canonical(self, text: str) -> str | None:
+        """Normalized form of an output or answer. Equal forms of the output and the answer must imply a match.
+
+        Returns:
+            None if the text cannot be compared this way
+        """
+        return text
+
 
 class TokenSequenceMatcher(SequenceMatcher):
     @override
@@ -40,23 +137,27 @@ class TokenSequenceMatcher(SequenceMatcher):
             (i, t, re.compile(re.sub(r"(\\ )+", r"\\s*", re.escape(t)), re.I))
             for i, t in enumerate(re.split(r"[\t\n]", ans))
         ]
+        self.scanner = _SequenceScanner(
+            [p for _, _, p in self.matchers], [_longest_literal(t) for _, t, _ in self.matchers]
+        )
 
     @override
     def __call__(self, output: str) -> Match:
         ok = True
-        last_pos = 0
         matched: list[tuple[int, int]] = []
-        for idx, tok, pat in self.matchers:
-            m = pat.search(output, last_pos)
-            if not m:
+        for (idx, tok, _), span in zip(self.matchers, self.scanner.scan(output), strict=True):
+            if not span:
                 print(colored(f"Fail to match the {idx}-th token:", fg=Fore.RED), tok)
                 ok = False
                 continue
-            matched.append(m.span())
-            last_pos = m.span()[1]
-        return Match(ok, matched, highlight_matched(output, matched))
+            matched.append(span)
+        return Match(ok, matched, highlight_matched(output, matched), _score(matched, self.matchers))
 
-        # todo 动态规划找最优匹配
+    @override
+    def canonical(self, text: str) -> str | None:
+        # 与正则一致：不区分大小写，词内空格可多可少
+        tokens = [re.sub(" +", " ", t).strip(" ").lower() for t in re.split(r"[\t\n]", text)]
+        return _join_stripped(tokens)
 
     @property
     @override
@@ -69,27 +170,172 @@ class LineSequenceMatcher(SequenceMatcher):
 
     @override
     def __init__(self, ans: str, *, ignore_spaces: bool = True) -> None:
+        self.ignore_spaces = ignore_spaces
         self.matchers = [
             (l, re.compile(re.sub(r"(\\ |\\t)+", r"\\s*", re.escape(l)) if ignore_spaces else re.escape(l)))
             for l in ans.splitlines()
         ]
+        self.scanner = _SequenceScanner(
+            [p for _, p in self.matchers], [_longest_literal(l, ignore_spaces) for l, _ in self.matchers]
+        )
 
     @override
     def __call__(self, output: str) -> Match:
         ok = True
-        last_pos = 0
         matched: list[tuple[int, int]] = []
-        for i, (line, pat) in enumerate(self.matchers):
-            m = pat.search(output, last_pos)
-            if not m:
+        for i, ((line, _), span) in enumerate(zip(self.matchers, self.scanner.scan(output), strict=True)):
+            if not span:
                 print(colored(f"Fail to match the {i}-th line:", fg=Fore.RED), line)
                 ok = False
                 continue
-            matched.append(m.span())
-            last_pos = m.span()[1]
-        return Match(ok, matched, highlight_matched(output, matched))
+            matched.append(span)
+        return Match(ok, matched, highlight_matched(output, matched), _score(matched, self.matchers))
 
     @property
     @override
     def num_patterns(self) -> int:
         return len(self.matchers)
+
+    @override
+    def canonical(self, text: str) -> str | None:
+        lines = text.splitlines()
+        if not self.ignore_spaces:
+            # 空行总能匹配
+            return "\n".join(l for l in lines if l)
+        return _join_stripped([re.sub(" +", " ", l).strip(" ") for l in lines])
+
+
+class AlignmentMatcher(SequenceMatcher):
+    """Best alignment of the answer against the output
+
+    The answer and the output are split into units (lines, or tokens separated by tabs and newlines),
+    and each answer unit is to be matched, in order, by an output unit equal to it after normalization.
+    Instead of taking the first occurrence of each unit greedily, the longest chain of occurrences is found
+    by dynamic programming, so that one misplaced unit does not fail all the following ones.
+    Blank units are ignored.
+    """
+
+    @override
+    def __init__(
+        self, ans: str, *, tokens: bool = False, ignore_spaces: bool = True, max_output: int = 1 << 16
+    ) -> None:
+        """
+        Args:
+            ans: expected output
+            tokens: split by tabs and newlines, and ignore case, like `TokenSequenceMatcher`
+            ignore_spaces: runs of spaces in a unit may be longer, shorter or missing in the output
+            max_output: only the first characters of the output are aligned, to bound the time spent on long
+                outputs; the answer units left after the alignment are matched greedily in the rest
+        """
+        self.tokens = tokens
+        self.ignore_spaces = ignore_spaces
+        self.max_output = max_output
+        self.sep = re.compile(r"[\t\n]" if tokens else r"\n")
+        self.unit_pattern = re.compile(r"[^\t\n]+" if tokens else r"[^\n]+")
+        self.units = [u for u in map(self._normalize, self.sep.split(ans)) if u]
+        self.keys = [self._key(u) for u in self.units]
+
+    def _normalize(self, unit: str) -> str:
+        unit = unit.strip()
+        if self.ignore_spaces:
+            unit = re.sub(r"[ \t]+", " ", unit)
+        return unit.lower() if self.tokens else unit
+
+    def _key(self, unit: str) -> str:
+        """Form of a normalized unit compared with the answer; spaces may be missing when ignored"""
+        return unit.replace(" ", "") if self.ignore_spaces else unit
+
+    def _index(self, output: str) -> tuple[list[str], list[tuple[int, int]]]:
+        """Keys and spans of the non-blank units of the output"""
+        keys: list[str] = []
+        spans: list[tuple[int, int]] = []
+        for m in self.unit_pattern.finditer(output):
+            if unit := self._normalize(m.group()):
+                keys.append(self._key(unit))
+                spans.append(m.span())
+        return keys, spans
+
+    @override
+    def __call__(self, output: str) -> Match:
+        keys, spans = self._index(output)
+        if keys == self.keys:
+            return Match(True, spans, highlight_matched(output, spans), 1.0)
+        # 每个键在输出中的出现位置（按顺序），只有前 max_output 个字符参与对齐
+        occurrences: dict[str, list[tuple[int, int]]] = {}
+        for key, span in zip(keys, spans, strict=True):
+            occurrences.setdefault(key, []).append(span)
+        cands: dict[str, list[tuple[int, int]]] = {}
+        for key in set(self.keys):
+            found = occurrences.get(key, [])
+            cands[key] = found[: bisect_right(found, self.max_output, key=lambda s: s[1])]
+        starts = {key: [s for s, _ in found] for key, found in cands.items()}
+
+        # Hunt–Szymanski：ends[k] 为长度 k+1 的匹配链的最小结束位置，links[k] 为其最后一个节点
+        ends: list[int] = []
+        links: list[int] = []
+        nodes: list[tuple[int, tuple[int, int], int]] = []
+        # 各层被更新的记录，以及每个单元上次处理时的记录位置
+        changed: list[int] = []
+        seen: dict[str, int] = {}
+        for i, key in enumerate(self.keys):
+            found, begins = cands[key], starts[key]
+            # 先基于上一轮的结果计算，保证同一答案单元只用一次
+            updates: dict[int, tuple[tuple[int, int], int]] = {}
+            since = seen.get(key)
+            seen[key] = len(changed)
+            if since is not None and len(changed) - since <= len(found):
+                # 同一单元上次处理后，只有前一层变小的层可能被更新（重复的单元只需检查这些层）
+                for k in sorted({k + 1 for k in changed[since:]}):
+                    j = bisect_left(begins, ends[k - 1])
+                    if j < len(found) and (k == len(ends) or found[j][1] < ends[k]):
+                        updates[k] = (found[j], links[k - 1])
+            else:
+                # 每层只取最早的出现，其后落在同一层的出现都被它支配
+                j = 0
+                while j < len(found):
+                    k = bisect_right(ends, begins[j])
+                    if k == len(ends) or found[j][1] < ends[k]:
+                        updates[k] = (found[j], links[k - 1] if k else -1)
+                        if k == len(ends):
+                            break
+                        j = bisect_left(begins, ends[k], j + 1)
+                    else:
+                        j += 1
+            for k, (span, prev) in sorted(updates.items()):
+                nodes.append((i, span, prev))
+                changed.append(k)
+                if k == len(ends):
+                    ends.append(span[1])
+                    links.append(len(nodes) - 1)
+                else:
+                    ends[k] = span[1]
+                    links[k] = len(nodes) - 1
+
+        aligned: dict[int, tuple[int, int]] = {}
+        node = links[-1] if links else -1
+        while node >= 0:
+            i, span, node = nodes[node]
+            aligned[i] = span
+        # 对齐范围之后的单元贪心匹配，不因长度限制判为失败
+        pos = ends[-1] if ends else 0
+        for i in range(max(aligned, default=-1) + 1, len(self.keys)):
+            found = occurrences.get(self.keys[i], [])
+            if (j := bisect_left(found, pos, key=lambda s: s[0])) < len(found):
+                aligned[i] = found[j]
+                pos = found[j][1]
+
+        for i, unit in enumerate(self.units):
+            if i not in aligned:
+                print(colored(f"Fail to match the {i}-th unit:", fg=Fore.RED), unit)
+        matched = [aligned[i] for i in sorted(aligned)]
+        ok = len(matched) == len(self.units)
+        return Match(ok, matched, highlight_matched(output, matched), _score(matched, self.units))
+
+    @property
+    @override
+    def num_patterns(self) -> int:
+        return len(self.units)
+
+    @override
+    def canonical(self, text: str) -> str | None:
+        return "\n".join(u for u in map(self._normalize, self.sep.split(text)) if u)
@@ -0,0 +1,102 @@
+import warnings
+from typing import override
+
+import numpy as np
+import numpy.typing as npt
+
+from . import results as R
+from .checker import Checker, CheckerResult, _AnswerCache
+
+type Tokens = tuple[npt.NDArray[np.float64], dict[int, str]]
+
+
+def parse_tokens(text: str) -> Tokens:
+    """Whitespace-separated tokens as floats
+
+    Returns:
+        values, with NaN in place of non-numeric tokens, and the non-numeric tokens by index
+    """
+    text = text.strip()
+    if not text:
+        # 只有空白时 fromstring 会返回 [-1.]
+        return np.empty(0), {}
+    with warnings.catch_warnings():
+        # 无法读完时 numpy 发出警告或抛出 ValueError，统一视为含非数值
+        warnings.simplefilter("error")
+        try:
+            return np.fromstring(text, sep=" "), {}
+        except (ValueError, DeprecationWarning):
+            pass
+    # 逐个识别，非数值的词需要原样匹配
+    words = text.split()
+    values = np.empty(len(words))
+    others: dict[int, str] = {}
+    for i, w in enumerate(words):
+        try:
+            values[i] = float(w)
+        except ValueError:
+            values[i] = np.nan
+            others[i] = w
+    return values, others
+
+
+class NumericChecker(Checker):
+    """Compare all numbers of the output with those of the answer, within tolerances
+
+    Output and answer are split on whitespace and parsed into arrays in one pass, then compared at once.
+    A number is accepted if `|out - ans| <= max(abs_tol, rel_tol * |ans|)`; infinities and NaN must match exactly.
+    Non-numeric tokens, if any, must be equal. Layout (line breaks, spacing) is ignored.
+
+    Requires NumPy (the `numeric` extra). The runner should keep the whole output, i.e. `output_trunc=None`.
+    """
+
+    def __init__(self, abs_tol: float = 1e-6, rel_tol: float = 1e-6) -> None:
+        super().__init__()
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+        # 答案在一次运行中不变，只解析一次
+        self._answers = _AnswerCache(parse_tokens)
+
+    @override
+    def check(self, index: int, stdin: str, stdout: str, ans: str) -> CheckerResult:
+        exp, exp_words = self._answers.get(index, ans)
+        out, out_words = parse_tokens(stdout)
+
+        n = min(len(exp), len(out))
+        a, b = exp[:n], out[:n]
+        with np.errstate(invalid="ignore", over="ignore"):
+            err = np.abs(b - a)
+            ok = (a == b) | (np.isfinite(a) & (err <= np.maximum(self.abs_tol, self.rel_tol * np.abs(a))))
+        ok |= np.isnan(a) & np.isnan(b)
+        # 非数值的词按原样比较
+        for i in exp_words.keys() | out_words.keys():
+            if i < n:
+                ok[i] = exp_words.get(i) == out_words.get(i)
+
+        bad = np.flatnonzero(~ok)
+        if len(bad) == 0 and len(exp) == len(out):
+            return R.AC()
+
+        msgs = []
+        if len(bad):
+            i = int(bad[0])
+            got = out_words.get(i, out[i])
+            expected_token = exp_words.get(i, exp[i])
+            msgs.append(f"{len(bad)} mismatches, first at #{i}: expected {expected_token}, got {got}")
+        if len(exp) != len(out):
+            msgs.append(f"expected {len(exp)} numbers, got {len(out)}")
+        numeric = np.isfinite(err)
+        if numeric.any():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rel = err[numeric] / np.abs(a[numeric])
+            msgs.append(f"max abs error {err[numeric].max():.3g}, max rel error {np.nanmax(rel, initial=0.0):.3g}")
+        return R.WA("; ".join(msgs))
+
+    @property
+    @override
+    def needs_stdin(self) -> bool:
+        return False
+
+    @override
+    def signature(self) -> str:
+        return f"{type(self).__qualname__}(abs_tol={self.abs_tol}, rel_tol={self.rel_tol})"
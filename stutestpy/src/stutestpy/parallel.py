@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import multiprocessing
+import multiprocessing.util
+import os
+import shutil
+import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import rich
+
+from .trace import Span, tracer
+
+if TYPE_CHECKING:
+    from .logs import TestLog
+    from .tester import Tester
+
+console = rich.get_console()
+
+# 每个工作进程持有一份独立的 Tester
+_tester: Tester | None = None
+
+
+def _init_worker(tester: Tester, trace: bool) -> None:
+    global _tester
+    if trace:
+        tracer.enable()
+    # 工作进程无法交互，避免抢占终端输入；需人工判定的用例记为 PD
+    sys.stdin = open(os.devnull)
+    tester.pause = False
+    tester.checker.interactive = False
+    worktree = tester.worktree
+    worktree.tmp_path = worktree.tmp_path / f"worker-{os.getpid()}"
+    worktree.tmp_path.mkdir(parents=True, exist_ok=True)
+    worktree.root = worktree.tmp_path
+    # 工作进程退出时不执行 atexit，单独注册清理：先清理构建目录，再删除工作进程目录
+    multiprocessing.util.Finalize(None, shutil.rmtree, (worktree.tmp_path, True), exitpriority=0)
+    multiprocessing.util.Finalize(None, worktree.cleanup, exitpriority=0)
+    _tester = tester
+
+
+def _test_one(folder: Path) -> tuple[TestLog, str, list[Span]]:
+    assert _tester is not None
+    console.begin_capture()
+    try:
+        log = _tester.test_one(folder)
+    finally:
+        output = console.end_capture()
+    return log, output, tracer.drain()
+
+
+def test_parallel(tester: Tester, folders: list[Path], jobs: int) -> Iterator[TestLog]:
+    """Test submissions in a process pool, yielding logs in the order of `folders`"""
+    # fork 时无需 pickle 整个 Tester（允许 lambda 形式的回调）
+    ctx = multiprocessing.get_context("fork") if sys.platform == "linux" else None
+    with ProcessPoolExecutor(jobs, mp_context=ctx, initializer=_init_worker, initargs=(tester, tracer.enabled)) as pool:
+        for log, output, spans in pool.map(_test_one, folders):
+            console.file.write(output)
+            console.file.flush()
+            tracer.extend(spans)
+            yield log
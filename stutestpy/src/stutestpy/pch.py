@@ -0,0 +1,122 @@
+import hashlib
+import os
+import re
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import rich
+
+from .fingerprint import INCLUDE_PATTERN, SOURCE_SUFFIXES, local_headers
+
+console = rich.get_console()
+
+type StrPath = str | Path
+
+DEFAULT_PRELUDE = [
+    "algorithm",
+    "cmath",
+    "cstdio",
+    "cstdlib",
+    "cstring",
+    "iomanip",
+    "iostream",
+    "map",
+    "set",
+    "sstream",
+    "string",
+    "vector",
+]
+
+# 在首个 #include 之前出现的宏定义可能改变标准头文件的含义
+_EARLY_DIRECTIVE = re.compile(rb"^[ \t]*#[ \t]*(define|undef)\b", re.M)
+
+
+class PrecompiledHeader:
+    """Precompiled header for a prelude of standard headers
+
+    One PCH is built per set of compiler flags under `root`. It is injected only into compilations whose
+    sources include nothing but covered standard headers (besides local ones) and define no macros
+    before their first `#include`.
+    """
+
+    def __init__(self, headers: list[str] | None = None, root: StrPath = "tmp/pch") -> None:
+        self.headers = headers or DEFAULT_PRELUDE
+        self.root = Path(root)
+        self._built: dict[str, list[str] | None] = {}
+        # 预估每次节省的时间：直接解析序言的耗时减去加载 PCH 的耗时
+        self._saving: dict[tuple[str, ...], float] = {}
+        self.uses = 0
+        self.fallbacks = 0
+        self.saved = 0.0
+
+    def covers(self, sources: list[Path], includes: list[Path] | None = None) -> bool:
+        covered = set(self.headers)
+        files = [f for f in sources if f.suffix in SOURCE_SUFFIXES]
+        for f in [*files, *local_headers(files, includes)]:
+            text = f.read_bytes()
+            first = INCLUDE_PATTERN.search(text)
+            if first and _EARLY_DIRECTIVE.search(text, 0, first.start()):
+                return False
+            for m in INCLUDE_PATTERN.finditer(text):
+                name = m[2].decode(errors="replace").strip()
+                local = (f.parent / name).is_file() or any((i / name).is_file() for i in includes or [])
+                if not local and name not in covered:
+                    return False
+        return True
+
+    def flags(self, args: list[str], sources: list[Path], includes: list[Path] | None = None) -> list[str]:
+        """Extra compiler flags to use the PCH, or empty if it is unavailable or incompatible"""
+        # 只链接目标文件时没有需要编译的源文件
+        if not any(f.suffix in SOURCE_SUFFIXES for f in sources) or not self.covers(sources, includes):
+            return []
+        key = hashlib.sha256("\0".join([*args, "", *self.headers]).encode()).hexdigest()[:16]
+        if key not in self._built:
+            self._built[key] = self._build(key, args)
+        return self._built[key] or []
+
+    def record_use(self, flags: list[str]) -> None:
+        self.uses += 1
+        self.saved += self._saving.get(tuple(flags), 0.0)
+
+    def record_fallback(self) -> None:
+        """Record that a compilation using the PCH had to be redone without it"""
+        self.fallbacks += 1
+
+    def _build(self, key: str, args: list[str]) -> list[str] | None:
+        d = self.root / key
+        d.mkdir(parents=True, exist_ok=True)
+        header = d / "prelude.hpp"
+        if not header.exists():
+            header.write_text("".join(f"#include <{h}>\n" for h in self.headers))
+        clang = "clang" in Path(args[0]).name
+        pch = d / ("prelude.pch" if clang else "prelude.hpp.gch")
+        flags = ["-include-pch", str(pch)] if clang else ["-include", str(header), "-Winvalid-pch"]
+
+        if not pch.exists():
+            console.print(f"Build PCH: {pch}", style="yellow")
+            fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+            os.close(fd)
+            r = subprocess.run([*args, "-x", "c++-header", header, "-o", tmp], capture_output=True)
+            if r.returncode != 0:
+                Path(tmp).unlink(missing_ok=True)
+                console.print("Failed to build PCH, compile without it", style="red")
+                return None
+            os.replace(tmp, pch)
+
+        empty = d / "empty.cpp"
+        empty.write_text("")
+        parse = self._time([*args, "-fsyntax-only", "-x", "c++", header])
+        load = self._time([*args, *flags, "-fsyntax-only", empty])
+        self._saving[tuple(flags)] = max(parse - load, 0.0)
+        return flags
+
+    @staticmethod
+    def _time(argv: list[StrPath]) -> float:
+        start = time.perf_counter()
+        subprocess.run(argv, capture_output=True)
+        return time.perf_counter() - start
+
+    def __str__(self) -> str:
+        return f"PCH: used {self.uses} times, {self.fallbacks} fallbacks, ~{self.saved:.1f}s compile time saved"
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import copy
+import functools
+import queue
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import rich
+
+from .logs import TestLog
+
+if TYPE_CHECKING:
+    from .tester import Tester
+
+console = rich.get_console()
+
+
+@dataclass
+class _Built:
+    index: int
+    log: TestLog
+    exe: Path | None
+    output: str
+
+
+class Pipeline:
+    """Overlap compilation and execution of submissions.
+
+    A pool of compile threads builds binaries ahead into a bounded queue, which is consumed by a pool of
+    run threads. Each compile thread owns a copy of the work tree under `tmp_path/compile-{k}`.
+    With a single run thread, judging happens in the foreground and manual judging still works;
+    otherwise the console output of each submission is printed as a whole, and cases needing manual
+    judgment are left pending.
+    """
+
+    def __init__(self, compile_workers: int = 2, run_workers: int = 1, queue_depth: int = 4) -> None:
+        self.compile_workers = compile_workers
+        self.run_workers = run_workers
+        self.queue_depth = queue_depth
+
+    def run(self, tester: Tester, folders: list[Path]) -> Iterator[TestLog]:
+        """Test submissions, yielding logs in the order of `folders`"""
+        tasks: queue.SimpleQueue[tuple[int, Path] | None] = queue.SimpleQueue()
+        for task in enumerate(folders):
+            tasks.put(task)
+        built: queue.Queue[_Built | None] = queue.Queue(self.queue_depth)
+
+        done: dict[int, TestLog] = {}
+        cond = threading.Condition()
+        errors: list[BaseException] = []
+        print_lock = threading.Lock()
+
+        def compile_stage(k: int) -> None:
+            worker = copy.copy(tester)
+            worker.pause = False
+            worker.worktree = copy.deepcopy(tester.worktree)
+            worker.worktree.tmp_path = tester.worktree.tmp_path / f"compile-{k}"
+            worker.worktree.tmp_path.mkdir(parents=True, exist_ok=True)
+            while (task := tasks.get()) is not None:
+                i, folder = task
+                log = TestLog(folder.name)
+                console.begin_capture()
+                try:
+                    console.print(f"Test {folder}", style="bold magenta")
+                    exe = worker.build(folder, log, f"example-{i}")
+                    worker.worktree.finish()
+                finally:
+                    output = console.end_capture()
+                built.put(_Built(i, log, exe, output))
+
+        def run_stage() -> None:
+            worker = tester
+            if self.run_workers > 1:
+                worker = copy.copy(tester)
+                worker.pause = False
+                worker.checker = copy.copy(tester.checker)
+                worker.checker.interactive = False
+            while (item := built.get()) is not None:
+                if self.run_workers > 1:
+                    console.begin_capture()
+                    try:
+                        if item.exe:
+                            worker.judge(item.exe, item.log)
+                    finally:
+                        output = console.end_capture()
+                    with print_lock:
+                        console.file.write(item.output + output)
+                        console.file.flush()
+                else:
+                    console.file.write(item.output)
+                    if item.exe:
+                        worker.judge(item.exe, item.log)
+                with cond:
+                    done[item.index] = item.log
+                    cond.notify_all()
+
+        def guarded(fn: Callable[..., None], *args: Any) -> None:
+            try:
+                fn(*args)
+            except BaseException as e:
+                with cond:
+                    errors.append(e)
+                    cond.notify_all()
+
+        compilers = [
+            threading.Thread(target=guarded, args=(compile_stage, k), daemon=True) for k in range(self.compile_workers)
+        ]
+        runners = [threading.Thread(target=guarded, args=(run_stage,), daemon=True) for _ in range(self.run_workers)]
+
+        def close() -> None:
+            for t in compilers:
+                t.join()
+            for _ in runners:
+                built.put(None)
+
+        for _ in compilers:
+            tasks.put(None)
+        for t in (*compilers, *runners):
+            t.start()
+        closer = threading.Thread(target=close, daemon=True)
+        closer.start()
+
+        def ready(i: int) -> bool:
+            return i in done or bool(errors)
+
+        for i in range(len(folders)):
+            with cond:
+                cond.wait_for(functools.partial(ready, i))
+                if errors:
+                    raise errors[0]
+                log = done.pop(i)
+            yield log
+
+        closer.join()
+        for t in runners:
+            t.join()
@@ -29,6 +29,23 @@ class WA(TestResult):
     color = "red"
 
 
+class PD(TestResult):
+    color = "yellow"
+
+    def __init__(self, msg: str = "Pending manual judgment") -> None:
+        super().__init__(msg)
+
+
+class PC(TestResult):
+    """Partially correct"""
+
+    color = "bright_yellow"
+
+    def __init__(self, score: float, msg: str = "") -> None:
+        super().__init__(msg or f"Partially correct ({score:.0%} matched)")
+        self.score = score
+
+
 class MISS(UnexpectedResult):
     color = "red"
 
@@ -45,6 +62,14 @@ class TLE(UnexpectedResult):
     color = "cyan"
 
 
+class MLE(UnexpectedResult):
+    color = "bright_magenta"
+
+
+class OLE(UnexpectedResult):
+    color = "bright_cyan"
+
+
 class CE(UnexpectedResult):
     color = "rgb(255,165,0)"
 
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import rich
+
+from . import results as R
+from .logs import LogWriter, load_logs, save_logs
+
+if TYPE_CHECKING:
+    from .cases import TestCases
+    from .checker import SequenceMatchChecker
+
+console = rich.get_console()
+
+
+def review_pending(save_path: Path, testcases: TestCases, checker: SequenceMatchChecker) -> int:
+    """Manually judge the cases left pending by a batch run, and merge the verdicts back into the logs
+
+    Args:
+        save_path: logs saved by `Tester.test_many`
+        testcases: test cases used for the run
+        checker: used to highlight the output against the answer
+
+    Returns:
+        int: number of cases judged
+    """
+    logs = load_logs(save_path)
+    total = sum(log.pending for log in logs)
+    judged = 0
+
+    # 每评完一个提交追加其最新记录，结束时再压缩
+    with LogWriter(save_path) as writer:
+        for log in logs:
+            if not log.pending or not log.result:
+                continue
+            for i, case in enumerate(log.result):
+                if case.status != R.PD().status:
+                    continue
+                console.print(f"[{judged + 1}/{total}] {log.submitter} case #{i}", style="bold magenta")
+                ans = testcases.answer(i)
+                matcher = checker.matcher(i, ans)
+                m = matcher(case.output or "")
+                console.print(f"Matched: {len(m.matched)}/{matcher.num_patterns}", style="red")
+                console.print("answer: ", style="blue")
+                console.print(ans, highlight=False, markup=False)
+                console.print("stdout: ", style="blue")
+                console.print(m.match_str, highlight=False, markup=False)
+                console.print("Manual judge (yes=AC, int=stop): ", end="", style="cyan")
+                res = checker.judge(console.input())
+                if isinstance(res, R.INT):
+                    writer.append(log)
+                    save_logs(save_path, logs)
+                    return judged
+
+                case.status = res.status
+                case.message = res.msg
+                log.pending -= 1
+                if isinstance(res, R.AC):
+                    log.passed += 1
+                    log.score += 1
+                judged += 1
+                console.print(res, style=res.color, highlight=False)
+            writer.append(log)
+    save_logs(save_path, logs)
+
+    console.print(f"Review completed! {judged} cases judged", style="bold green")
+    return judged
@@ -1,32 +1,470 @@
+import codecs
+import math
+import os
+import selectors
+import shutil
+import signal
 import subprocess
+import sys
+import time
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import IO, TYPE_CHECKING, cast
 
 import rich
 from result import Err, Ok, Result
 
 from . import results as R
+from .symbolizer import Symbolizer
+from .trace import tracer
 from .utils import auto_decode, trunc_lines
 
+if TYPE_CHECKING:
+    from .checker import StreamMonitor
+
 console = rich.get_console()
 
+# Windows 上 selectors 不支持管道，退回逐个运行
+_MULTIPLEX = os.name == "posix"
+
+if _MULTIPLEX:
+    import resource
+
+    # preexec_fn 在有其他线程时不安全（流水线、分诊等都在线程中运行），改为由包装程序设置限制后 exec 被测程序
+    _PRLIMIT = shutil.which("prlimit") if sys.platform == "linux" else None
+    _PRLIMIT_OPTIONS = {
+        resource.RLIMIT_AS: "as",
+        resource.RLIMIT_CPU: "cpu",
+        resource.RLIMIT_FSIZE: "fsize",
+        resource.RLIMIT_NPROC: "nproc",
+    }
+    # 没有 util-linux 的 prlimit 命令时以 Python 包装，启动较慢
+    _SETRLIMIT = (
+        "import os, resource, sys\n"
+        "i = sys.argv.index('--')\n"
+        "for arg in sys.argv[1:i]:\n"
+        "    res, soft, hard = map(int, arg.split(':'))\n"
+        "    resource.setrlimit(res, (soft, hard))\n"
+        "os.execv(sys.argv[i + 1], sys.argv[i + 1 :])\n"
+    )
+
+_CHUNK = 1 << 16
+# 保留的标准错误输出上限
+_STDERR_KEEP = 1 << 20
+
+
+def _decode_stderr(stderr: bytes) -> str:
+    """Decode standard error kept up to `_STDERR_KEEP` bytes"""
+    if len(stderr) >= _STDERR_KEEP:
+        # 截断处可能在 UTF-8 字符中间，丢弃不完整的结尾，避免整体被当作 GBK 解码
+        try:
+            return codecs.getincrementaldecoder("utf-8")().decode(stderr)
+        except UnicodeDecodeError:
+            pass
+    return auto_decode(stderr)
+
+
+# WA 来自输出监视器
+type RunResult = Result[str, R.RE | R.TLE | R.MLE | R.OLE | R.UKE | R.WA]
+# 文件直接作为子进程的标准输入，None 表示空输入
+type Stdin = str | Path | None
+
+
+@dataclass
+class Execution:
+    result: RunResult
+    time: float
+    """Wall time in seconds"""
+    cpu_time: float | None = None
+    """User + system CPU time in seconds"""
+    memory: int | None = None
+    """Peak resident set size in KiB reported by `wait4`.
+    On Linux it includes the pages inherited from the grader at fork time, so small values are inflated."""
+    streamed: bool = False
+    """Whether the whole stdout was fed to the monitor of the case"""
+
+
+@dataclass
+class _Job:
+    index: int
+    proc: subprocess.Popen[bytes]
+    stdin: memoryview
+    start: float
+    deadline: float
+    stdout: bytearray = field(default_factory=bytearray)
+    stderr: bytearray = field(default_factory=bytearray)
+    streams: int = 0
+    timed_out: bool = False
+    written: int = 0
+    lines: int = 0
+    dropped: bool = False
+    flooded: str = ""
+    monitor: "StreamMonitor | None" = None
+    diverged: str = ""
+    status: int = 0
+    rusage: "resource.struct_rusage | None" = None
+
 
 class TestRunner:
-    def __init__(self, time_limit: float, output_trunc: int = 100) -> None:
+    def __init__(
+        self,
+        time_limit: float,
+        output_trunc: int | None = 100,
+        *,
+        output_limit: int = 64 << 20,
+        line_limit: int | None = None,
+        concurrency: int = 1,
+        memory_limit: int | None = None,
+        cpu_limit: float | None = None,
+        file_size_limit: int | None = None,
+        process_limit: int | None = None,
+        symbolizer: Symbolizer | None = None,
+    ) -> None:
+        """
+        Args:
+            time_limit: wall time limit in seconds
+            output_trunc: max number of output lines kept, or None to keep all. Output beyond is read and dropped.
+            output_limit: max bytes written to stdout and stderr. The process is killed as soon as it is exceeded.
+            line_limit: max number of stdout lines, enforced the same way
+            concurrency: max number of test cases running at the same time
+            memory_limit: address space limit in MiB. Note that AddressSanitizer reserves huge address space,
+                so only use it with uninstrumented builds. Exceeding it makes allocations fail rather than
+                killing the process: it is reported as MLE when the program dies with `std::bad_alloc`,
+                and as whatever the program does otherwise (e.g. RE on a null `malloc` result).
+            cpu_limit: CPU time limit in seconds
+            file_size_limit: max size in bytes of files written by the process
+            process_limit: max number of processes of the user (RLIMIT_NPROC)
+            symbolizer: run programs with sanitizer symbolization disabled, and symbolize the reports
+                of each `run_many` call in a batch afterwards
+        """
         self.time_limit = time_limit
         self.output_trunc = output_trunc
+        self.output_limit = output_limit
+        self.line_limit = line_limit
+        self.concurrency = concurrency
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.file_size_limit = file_size_limit
+        self.process_limit = process_limit
+        self.symbolizer = symbolizer
+        self._env = Symbolizer.environ() if symbolizer else None
+
+    def signature(self) -> str:
+        """Configuration affecting the results"""
+        return repr(
+            (
+                self.time_limit,
+                self.output_trunc,
+                self.output_limit,
+                self.line_limit,
+                self.memory_limit,
+                self.cpu_limit,
+                self.file_size_limit,
+                self.process_limit,
+                self.symbolizer is not None,
+            )
+        )
+
+    def run(self, exe: Path, stdin: Stdin) -> RunResult:
+        return self.run_many(exe, [stdin])[0].result
+
+    def run_many(
+        self, exe: Path, stdins: Sequence[Stdin], monitors: Sequence["StreamMonitor | None"] | None = None
+    ) -> list[Execution]:
+        """Run the executable once per input
+
+        Up to `concurrency` processes run at the same time, with their pipes multiplexed in a single
+        selector loop. Results are in the order of `stdins`.
+        A `Path` is opened and handed to the process as its stdin, without being read by the grader.
+        The stdout of each case is fed to its monitor, if any, as it is read; the process is killed
+        as soon as the monitor rejects it, with a WA result.
+        """
+        monitors = monitors or [None] * len(stdins)
+        if not _MULTIPLEX:
+            executions = []
+            for i, stdin in enumerate(stdins):
+                with tracer.span("case", "runner", case=i):
+                    executions.append(self._run_blocking(exe, stdin, monitors[i]))
+            self._symbolize(executions)
+            return executions
+
+        results: list[Execution | None] = [None] * len(stdins)
+        pending = deque(enumerate(stdins))
+        running: list[_Job] = []
+        with selectors.DefaultSelector() as sel:
+            while pending or running:
+                while pending and len(running) < self.concurrency:
+                    i, stdin = pending.popleft()
+                    try:
+                        running.append(self._spawn(sel, exe, i, stdin, monitors[i]))
+                    except Exception as e:
+                        results[i] = Execution(Err(R.UKE(str(e))), 0.0)
+
+                if not running:
+                    continue
+                now = time.monotonic()
+                timeout = max(min(job.deadline for job in running) - now, 0.0)
+                if any(job.streams == 0 for job in running):
+                    # 输出已关闭，等待进程退出
+                    timeout = min(timeout, 0.005)
+                for key, _ in sel.select(timeout):
+                    self._transfer(sel, key)
+
+                now = time.monotonic()
+                for job in running.copy():
+                    aborted = job.flooded or job.diverged
+                    if aborted or not (job.streams == 0 and self._reap(job, os.WNOHANG)):
+                        if not aborted and now < job.deadline:
+                            continue
+                        job.timed_out = not aborted
+                        # 不用 Popen.kill：它会先 poll 回收已退出的进程，之后 wait4 无法取得资源用量
+                        os.kill(job.proc.pid, signal.SIGKILL)
+                        self._reap(job, 0)
+                        if job.diverged:
+                            # 程序可能在被终止前已经出错，保留尚未读取的标准错误输出
+                            self._drain_stderr(job)
+                        self._close_all(sel, job)
+                    running.remove(job)
+                    results[job.index] = self._finish(exe, job, now - job.start)
+
+        executions = [r for r in results if r is not None]
+        self._symbolize(executions)
+        return executions
+
+    def _symbolize(self, executions: list[Execution]) -> None:
+        """Symbolize the sanitizer reports of runtime errors, while the executable still exists"""
+        if self.symbolizer is None:
+            return
+        errors = [
+            e.result.err_value for e in executions if isinstance(e.result, Err) and isinstance(e.result.err_value, R.RE)
+        ]
+        if not errors:
+            return
+        with tracer.span("symbolize", "runner", reports=len(errors)):
+            for e, msg in zip(errors, self.symbolizer.symbolize_many([e.msg for e in errors]), strict=True):
+                e.msg = msg
+
+    def _limits(self) -> list[tuple[int, tuple[int, int]]]:
+        limits: list[tuple[int, tuple[int, int]]] = []
+        if self.memory_limit is not None:
+            limits.append((resource.RLIMIT_AS, (self.memory_limit << 20,) * 2))
+        if self.cpu_limit is not None:
+            # 软限制触发 SIGXCPU，硬限制兜底 SIGKILL
+            seconds = max(math.ceil(self.cpu_limit), 1)
+            limits.append((resource.RLIMIT_CPU, (seconds, seconds + 1)))
+        if self.file_size_limit is not None:
+            limits.append((resource.RLIMIT_FSIZE, (self.file_size_limit,) * 2))
+        if self.process_limit is not None:
+            limits.append((resource.RLIMIT_NPROC, (self.process_limit,) * 2))
+        return limits
+
+    def _spawn(
+        self, sel: selectors.BaseSelector, exe: Path, index: int, stdin: Stdin, monitor: "StreamMonitor | None"
+    ) -> _Job:
+        argv: list[str | Path] = [exe]
+        if (limits := self._limits()) and _PRLIMIT:
+            argv = [_PRLIMIT, *(f"--{_PRLIMIT_OPTIONS[res]}={soft}:{hard}" for res, (soft, hard) in limits), "--", exe]
+        elif limits:
+            options = [f"{res}:{soft}:{hard}" for res, (soft, hard) in limits]
+            argv = [sys.executable, "-I", "-S", "-c", _SETRLIMIT, *options, "--", exe]
+
+        if isinstance(stdin, str):
+            p = subprocess.Popen(
+                argv,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=self._env,
+            )
+            data = memoryview(stdin.encode())
+        else:
+            with open(stdin or os.devnull, "rb") as f:
+                p = subprocess.Popen(argv, stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self._env)
+            data = memoryview(b"")
+        now = time.monotonic()
+        job = _Job(index, p, data, now, now + self.time_limit, monitor=monitor)
+        assert p.stdout and p.stderr
+        for stream, event in ((p.stdout, selectors.EVENT_READ), (p.stderr, selectors.EVENT_READ)):
+            os.set_blocking(stream.fileno(), False)
+            sel.register(stream, event, job)
+            job.streams += 1
+        if p.stdin and job.stdin:
+            os.set_blocking(p.stdin.fileno(), False)
+            sel.register(p.stdin, selectors.EVENT_WRITE, job)
+        elif p.stdin:
+            p.stdin.close()
+        return job
+
+    def _transfer(self, sel: selectors.BaseSelector, key: selectors.SelectorKey) -> None:
+        job: _Job = key.data
+        # 注册的都是子进程的管道
+        stream = cast(IO[bytes], key.fileobj)
+        if stream is job.proc.stdin:
+            try:
+                n = os.write(key.fd, job.stdin[:_CHUNK])
+            except BrokenPipeError:
+                n = len(job.stdin)
+            except BlockingIOError:
+                return
+            job.stdin = job.stdin[n:]
+            if not job.stdin:
+                sel.unregister(stream)
+                stream.close()
+            return
+
+        data = os.read(key.fd, _CHUNK)
+        if not data:
+            sel.unregister(stream)
+            stream.close()
+            job.streams -= 1
+            return
+
+        job.written += len(data)
+        if stream is job.proc.stdout:
+            self._keep_stdout(job, data)
+            if job.monitor and not job.diverged:
+                job.diverged = job.monitor.feed(data) or ""
+        elif len(job.stderr) < _STDERR_KEEP:
+            job.stderr.extend(data[: _STDERR_KEEP - len(job.stderr)])
+        if job.written > self.output_limit:
+            job.flooded = f"Output exceeded {self.output_limit} bytes"
+        elif self.line_limit is not None and job.lines > self.line_limit:
+            job.flooded = f"Output exceeded {self.line_limit} lines"
+
+    def _keep_stdout(self, job: _Job, data: bytes) -> None:
+        """Keep only the first `output_trunc` lines, which is all that gets decoded"""
+        before = job.lines
+        job.lines += data.count(b"\n")
+        if job.dropped:
+            return
+        if self.output_trunc is None or job.lines < self.output_trunc:
+            job.stdout.extend(data)
+            return
+        # 截断到第 output_trunc 个换行符之后
+        pos = -1
+        for _ in range(self.output_trunc - before):
+            pos = data.index(b"\n", pos + 1)
+        job.stdout.extend(data[: pos + 1])
+        job.dropped = pos + 1 < len(data)
+
+    def _decode_stdout(self, job: _Job) -> str:
+        text = auto_decode(bytes(job.stdout))
+        if job.dropped or (self.output_trunc is not None and job.lines > self.output_trunc):
+            return "\n".join(text.splitlines()) + "\n..."
+        return text if self.output_trunc is None else trunc_lines(text, self.output_trunc)
+
+    def _drain_stderr(self, job: _Job) -> None:
+        stream = job.proc.stderr
+        if stream is None or stream.closed:
+            return
+        try:
+            while (data := os.read(stream.fileno(), _CHUNK)) and len(job.stderr) < _STDERR_KEEP:
+                job.stderr.extend(data[: _STDERR_KEEP - len(job.stderr)])
+        except BlockingIOError:
+            pass
+
+    def _close_all(self, sel: selectors.BaseSelector, job: _Job) -> None:
+        for stream in (job.proc.stdin, job.proc.stdout, job.proc.stderr):
+            if stream and not stream.closed:
+                if sel.get_map().get(stream.fileno()):
+                    sel.unregister(stream)
+                stream.close()
+        job.streams = 0
+
+    def _reap(self, job: _Job, options: int) -> bool:
+        """Wait for the process with `wait4` to collect its resource usage"""
+        pid, status, rusage = os.wait4(job.proc.pid, options)
+        if pid == 0:
+            return False
+        job.status = status
+        job.rusage = rusage
+        job.proc.returncode = os.waitstatus_to_exitcode(status)
+        return True
+
+    def _finish(self, exe: Path, job: _Job, wall_time: float) -> Execution:
+        cpu_time = memory = None
+        if job.rusage:
+            cpu_time = job.rusage.ru_utime + job.rusage.ru_stime
+            # macOS 上单位为字节
+            memory = job.rusage.ru_maxrss // 1024 if sys.platform == "darwin" else job.rusage.ru_maxrss
+        result: RunResult
+        code = job.proc.returncode
+        if job.diverged and code == -signal.SIGKILL:
+            # 由监视器终止；若程序已经出错（如已写出 sanitizer 报告），仍判为运行错误
+            code = 0
+        match self._verdict(exe, code, job.stderr, cpu_time, job.timed_out, job.flooded):
+            case Ok() if job.diverged:
+                result = Err(R.WA(job.diverged))
+            case Ok():
+                result = Ok(self._decode_stdout(job))
+            case Err() as e:
+                result = e
+        # 时间取自 time.monotonic，与 tracer 一致
+        tracer.add("case", "runner", int(job.start * 1e9), int(wall_time * 1e9), case=job.index, pid=job.proc.pid)
+        return Execution(result, wall_time, cpu_time, memory, streamed=job.monitor is not None and result.is_ok())
+
+    def _verdict(
+        self,
+        exe: Path,
+        code: int,
+        stderr: bytes | bytearray,
+        job_cpu: float | None,
+        timed_out: bool = False,
+        flooded: str = "",
+    ) -> Result[None, R.RE | R.TLE | R.MLE | R.OLE]:
+        """Verdict of a finished process, Ok if its output is to be checked"""
+        if timed_out:
+            return Err(R.TLE(f"Command '{exe}' timed out after {self.time_limit} seconds"))
+        if flooded:
+            return Err(R.OLE(flooded))
+        if code == -signal.SIGXCPU or (
+            code == -signal.SIGKILL and self.cpu_limit is not None and (job_cpu or 0.0) >= self.cpu_limit
+        ):
+            return Err(R.TLE(f"Command '{exe}' exceeded CPU time limit of {self.cpu_limit} seconds"))
+        # 地址空间限制使分配失败而非直接杀死进程，只能依据 bad_alloc 判断
+        if self.memory_limit is not None and code != 0 and b"bad_alloc" in stderr:
+            return Err(R.MLE(f"Command '{exe}' exceeded memory limit of {self.memory_limit} MiB"))
+        if stderr:
+            return Err(R.RE(_decode_stderr(bytes(stderr))))
+        if code < 0:
+            try:
+                name = signal.Signals(-code).name
+            except ValueError:
+                name = f"signal {-code}"
+            return Err(R.RE(f"Command '{exe}' died with {name}"))
+        return Ok(None)
 
-    def run(self, exe: Path, stdin: str) -> Result[str, R.RE | R.TLE | R.UKE]:
+    def _run_blocking(self, exe: Path, stdin: Stdin, monitor: "StreamMonitor | None" = None) -> Execution:
+        start = time.monotonic()
         try:
-            p = subprocess.Popen(exe, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if isinstance(stdin, str):
+                p = subprocess.Popen(
+                    exe, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self._env
+                )
+                data: bytes | None = stdin.encode()
+            else:
+                with open(stdin or os.devnull, "rb") as f:
+                    p = subprocess.Popen(exe, stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self._env)
+                data = None
             try:
-                stdout, stderr = p.communicate(stdin.encode(), timeout=self.time_limit)
+                stdout, stderr = p.communicate(data, timeout=self.time_limit)
             except subprocess.TimeoutExpired as e:
                 p.kill()
                 p.communicate()
-                return Err(R.TLE(str(e)))
+                return Execution(Err(R.TLE(str(e))), time.monotonic() - start)
+            if len(stdout) + len(stderr) > self.output_limit:
+                return Execution(Err(R.OLE(f"Output exceeded {self.output_limit} bytes")), time.monotonic() - start)
             if stderr:
-                return Err(R.RE(auto_decode(stderr)))
+                return Execution(Err(R.RE(auto_decode(stderr))), time.monotonic() - start)
+            # 与 _finish 一致，只检查正常结束的程序的输出
+            if monitor and (msg := monitor.feed(stdout)):
+                return Execution(Err(R.WA(msg)), time.monotonic() - start)
             p.terminate()
-            return Ok(trunc_lines(auto_decode(stdout), self.output_trunc))
+            text = auto_decode(stdout)
+            if self.output_trunc is not None:
+                text = trunc_lines(text, self.output_trunc)
+            return Execution(Ok(text), time.monotonic() - start, streamed=monitor is not None)
         except Exception as e:
-            return Err(R.UKE(str(e)))
+            return Execution(Err(R.UKE(str(e))), time.monotonic() - start)
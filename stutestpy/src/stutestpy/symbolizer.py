@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+from collections import defaultdict
+from collections.abc import Sequence
+from pathlib import Path
+
+# 未符号化的栈帧：#0 0x56013fb44332  (/path/to/a.exe+0x2332)，compiler-rt 15 起可能带有 (BuildId: ...)
+FRAME_PATTERN = re.compile(r"^([ \t]*#\d+ 0x[0-9a-f]+) +\((\S+?)\+(0x[0-9a-f]+)\)( \(BuildId: [0-9a-f]+\))?$", re.M)
+# SUMMARY 行中的位置
+SUMMARY_PATTERN = re.compile(r"^(SUMMARY: \w+Sanitizer: .*?)\((\S+?)\+(0x[0-9a-f]+)\)", re.M)
+
+type Symbol = tuple[str, str] | None
+
+
+class Symbolizer:
+    """Symbolize sanitizer reports outside the crashing processes
+
+    Programs are run with symbolization disabled (see `environ`), so that their reports only contain
+    module offsets. `symbolize_many` then resolves all the frames of a batch of reports with a single
+    `llvm-symbolizer` (or `addr2line`) call per module. Results are cached by module content hash and
+    offset, so frames shared by cases and by submissions (runtime libraries) are resolved once.
+    """
+
+    def __init__(self, tool: str | None = None) -> None:
+        """
+        Args:
+            tool: path of `llvm-symbolizer` or `addr2line`, found in PATH if omitted.
+                Reports are left as is if none is available.
+        """
+        self.tool = tool or shutil.which("llvm-symbolizer") or shutil.which("addr2line")
+        self.llvm = self.tool is not None and "llvm-symbolizer" in Path(self.tool).name
+        self._symbols: dict[tuple[str, int], Symbol] = {}
+        self._hashes: dict[tuple[str, int, int, int], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def environ(env: dict[str, str] | None = None) -> dict[str, str]:
+        """Environment disabling in-process symbolization, based on `env` or the current one"""
+        env = dict(os.environ if env is None else env)
+        for name in ("ASAN_OPTIONS", "UBSAN_OPTIONS"):
+            env[name] = ":".join(filter(None, (env.get(name), "symbolize=0")))
+        return env
+
+    def symbolize(self, report: str) -> str:
+        return self.symbolize_many([report])[0]
+
+    def symbolize_many(self, reports: Sequence[str]) -> list[str]:
+        """Rewrite the unsymbolized frames of the reports"""
+        if self.tool is None:
+            return list(reports)
+
+        wanted: dict[str, set[int]] = defaultdict(set)
+        for report in reports:
+            for pattern in (FRAME_PATTERN, SUMMARY_PATTERN):
+                for m in pattern.finditer(report):
+                    wanted[m[2]].add(int(m[3], 16))
+
+        # 模块路径 -> 内容哈希
+        hashes: dict[str, str] = {}
+        for module, offsets in wanted.items():
+            if (digest := self._hash(module)) is None:
+                continue
+            hashes[module] = digest
+            with self._lock:
+                missing = sorted(o for o in offsets if (digest, o) not in self._symbols)
+                self.hits += len(offsets) - len(missing)
+                self.misses += len(missing)
+            if missing:
+                resolved = self._resolve(module, missing)
+                with self._lock:
+                    self._symbols.update(((digest, o), s) for o, s in zip(missing, resolved, strict=True))
+
+        def lookup(module: str, offset: str) -> Symbol:
+            if (digest := hashes.get(module)) is None:
+                return None
+            return self._symbols.get((digest, int(offset, 16)))
+
+        def frame(m: re.Match[str]) -> str:
+            if (symbol := lookup(m[2], m[3])) is None:
+                return m[0]
+            func, loc = symbol
+            return f"{m[1]} in {func} {loc}" if loc else f"{m[1]} in {func} ({m[2]}+{m[3]})"
+
+        def summary(m: re.Match[str]) -> str:
+            if (symbol := lookup(m[2], m[3])) is None or not symbol[1]:
+                return m[0]
+            func, loc = symbol
+            return f"{m[1]}{loc} in {func}"
+
+        return [SUMMARY_PATTERN.sub(summary, FRAME_PATTERN.sub(frame, r)) for r in reports]
+
+    def _hash(self, module: str) -> str | None:
+        try:
+            st = os.stat(module)
+        except OSError:
+            return None
+        key = (module, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if digest := self._hashes.get(key):
+                return digest
+        try:
+            with open(module, "rb") as f:
+                digest = hashlib.file_digest(f, "blake2b").hexdigest()
+        except OSError:
+            return None
+        with self._lock:
+            self._hashes[key] = digest
+        return digest
+
+    def _resolve(self, module: str, offsets: list[int]) -> list[Symbol]:
+        """Symbolize offsets of a module with a single call of the tool"""
+        assert self.tool is not None
+        addresses = [hex(o) for o in offsets]
+        try:
+            if self.llvm:
+                r = subprocess.run(
+                    [self.tool, f"--obj={module}", "--no-inlines"],
+                    input="\n".join(addresses) + "\n",
+                    capture_output=True,
+                    text=True,
+                    timeout=60,
+                )
+                # 每个地址输出函数名与位置两行，之后为空行
+                lines = [line for line in r.stdout.splitlines() if line]
+            else:
+                r = subprocess.run(
+                    [self.tool, "-f", "-C", "-e", module, *addresses], capture_output=True, text=True, timeout=60
+                )
+                lines = r.stdout.splitlines()
+        except (OSError, subprocess.SubprocessError):
+            return [None] * len(offsets)
+        if len(lines) != 2 * len(offsets):
+            return [None] * len(offsets)
+
+        symbols: list[Symbol] = []
+        for func, loc in zip(lines[::2], lines[1::2], strict=True):
+            loc = loc.split(" (discriminator")[0]
+            if func == "??":
+                symbols.append(None)
+            else:
+                symbols.append((func, "" if loc.startswith("??") else loc))
+        return symbols
+
+    def __str__(self) -> str:
+        return f"Symbolizer ({self.tool}): {self.hits} cached frames, {self.misses} resolved"
@@ -1,42 +1,34 @@
 from __future__ import annotations
 
-import json
+import copy
+import hashlib
+import os
 from collections.abc import Callable
-from dataclasses import dataclass
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import rich
-from dataclasses_json import DataClassJsonMixin
-from result import Err, Ok
+from result import Err, Ok, Result
 
 from . import results as R
+from .fingerprint import compile_fingerprint
+from .logs import LogWriter, RerunLog, TestCaseLog, TestLog, load_logs, save_logs
+from .trace import tracer
 
 if TYPE_CHECKING:
     from .cases import TestCases
-    from .checker import Checker
+    from .checker import Checker, StreamMonitor
     from .compiler import Compiler
+    from .pipeline import Pipeline
     from .runner import TestRunner
     from .worktree import WorkTree
 
 
 console = rich.get_console()
 
-
-@dataclass
-class TestCaseLog(DataClassJsonMixin):
-    output: str | None
-    status: str
-    message: str
-
-
-@dataclass
-class TestLog(DataClassJsonMixin):
-    submitter: str
-    status: str = ""
-    result: list[TestCaseLog] | None = None
-    message: str = ""
-    passed: int = 0
+# 快速构建下这些结果的用例默认用带 sanitizer 的构建重新运行（PD 为批量模式下未通过自动检查的用例）。
+# 普通的 WA、TLE 很少由内存错误引起，重新运行只会多花一个时间限制
+SANITIZE_STATUSES = (R.RE().status, R.PD().status)
 
 
 class Tester:
@@ -48,6 +40,7 @@ class Tester:
         self.compiler = compiler
         self.runner = runner
         self.checker = checker
+        self.checker.reserve(len(testcases))
 
         self.tmp_path = Path("tmp")
 
@@ -55,87 +48,355 @@ class Tester:
         self.time_limit = 1.0
         self.tle_as_ac = False
         self.tle_handler: Callable[[str, str], R.TestResult | None] | None = None
+        self.pause = True
+        # 增量测试时，上次的日志
+        self.previous: dict[str, TestLog] = {}
+        self._case_keys: list[str] | None = None
+        # 语法检查阶段发现的编译错误
+        self.triaged: dict[str, R.CE] = {}
+        self.triage_workers = os.cpu_count() or 1
+        # 分级评测：先用快速构建评测，失败的用例再用 compiler 构建重新运行
+        self.fast_compiler: Compiler | None = None
+        self.sanitize_statuses: tuple[str, ...] = SANITIZE_STATUSES
+        # 提交者对应的文件夹，重新构建时使用
+        self._folders: dict[str, Path] = {}
+
+    def case_keys(self) -> list[str]:
+        """Fingerprints of test cases, including the runner and checker configuration"""
+        if self._case_keys is None:
+            config = f"{self.runner.signature()}\0{self.checker.signature()}".encode()
+            self._case_keys = [hashlib.sha256(config + f.encode()).hexdigest() for f in self.testcases.fingerprints()]
+        return self._case_keys
+
+    def reusable(self, log: TestLog) -> dict[int, TestCaseLog]:
+        """Results of the previous run that are still valid for the submission"""
+        prev = self.previous.get(log.submitter)
+        if not (prev and prev.result and log.fingerprint and prev.fingerprint == log.fingerprint):
+            return {}
+        keys = self.case_keys()
+        return {i: c for i, c in enumerate(prev.result) if i < len(keys) and c.fingerprint == keys[i]}
 
     def run_tests(self, exe: Path, log: TestLog) -> bool:
         results: list[R.TestResult] = []
         log.result = []
 
-        for i, (tc_in, tc_ans) in enumerate(self.testcases):
+        inputs = self.testcases.inputs()
+        keys = self.case_keys()
+        reused = self.reusable(log)
+        # 只运行有变化的用例
+        todo = [i for i in range(len(inputs)) if i not in reused]
+        # 边运行边检查输出，确定错误时立即终止
+        monitors: dict[int, StreamMonitor] = {}
+        if self.checker.monitors_output:
+            monitors = {i: m for i in todo if (m := self.checker.monitor(i, self.testcases.answer(i)))}
+        with tracer.span("run", "tester", submitter=log.submitter, cases=len(todo)):
+            stdins = [inputs[i] for i in todo]
+            if monitors:
+                ran = self.runner.run_many(exe, stdins, [monitors.get(i) for i in todo])
+            else:
+                ran = self.runner.run_many(exe, stdins)
+            executions = dict(zip(todo, ran, strict=True))
+        for i in range(len(inputs)):
             console.print(f"Case {i}", style="bold bright_blue")
+            if case := reused.get(i):
+                log.result.append(case)
+                log.passed += case.status == R.AC().status
+                log.pending += case.status == R.PD().status
+                log.score += case.score if case.score is not None else case.status == R.AC().status
+                console.print(f"{case.status}: {case.message} (unchanged)", highlight=False, markup=False)
+                continue
 
-            match self.runner.run(exe, tc_in):
-                case Ok(out):
-                    res = self.checker.check(i, stdin=tc_in, stdout=out, ans=tc_ans)
-                    if isinstance(res, R.AC | R.WA):
-                        results.append(res)
-                        log.result.append(TestCaseLog(out, res.status, res.msg))
-                        if isinstance(res, R.AC):
-                            log.passed += 1
-
-                        console.print(results[-1], style=results[-1].color, highlight=False)
+            execution = executions[i]
+            usage = (execution.time, execution.cpu_time, execution.memory, keys[i])
 
-                    elif isinstance(res, R.INT):
+            match execution.result:
+                case Ok(out):
+                    with tracer.span("check", "tester", submitter=log.submitter, case=i):
+                        # 监视器无法判定时（如输出不是 UTF-8）仍由 check 判定
+                        res = monitors[i].finish() if execution.streamed else None
+                        if res is None:
+                            tc_in = self.testcases.stdin(i) if self.checker.needs_stdin else ""
+                            res = self.checker.check(i, stdin=tc_in, stdout=out, ans=self.testcases.answer(i))
+                    if isinstance(res, R.INT):
                         console.print("Interrupt", style="bold bright_cyan")
                         return False
+
+                    results.append(res)
+                    score = res.score if isinstance(res, R.PC) else None
+                    log.result.append(TestCaseLog(out, res.status, res.msg, *usage, score=score))
+                    if isinstance(res, R.AC):
+                        log.passed += 1
+                        log.score += 1
+                    elif isinstance(res, R.PC):
+                        log.score += res.score
+                    elif isinstance(res, R.PD):
+                        log.pending += 1
+
+                    with tracer.span("render", "tester", submitter=log.submitter, case=i):
+                        console.print(results[-1], style=results[-1].color, highlight=False)
                 case Err(e):
                     # 暂时放弃TLE的处理
                     results.append(e)
-                    log.result.append(TestCaseLog(str(e), e.status, e.msg))
+                    log.result.append(TestCaseLog(str(e), e.status, e.msg, *usage))
 
-                    console.print(results[-1].status, style=results[-1].color, highlight=False, end=": ")
-                    console.print(results[-1].msg, highlight=False, markup=False)
+                    with tracer.span("render", "tester", submitter=log.submitter, case=i):
+                        console.print(results[-1].status, style=results[-1].color, highlight=False, end=": ")
+                        console.print(results[-1].msg, highlight=False, markup=False)
 
         return True
 
-    def test_one(self, folder_: Path | str) -> TestLog:
-        folder = Path(folder_)
-        log = TestLog(folder.name)
-        console.print(f"Test {folder}", style="bold magenta")
-
+    def build(self, folder: Path, log: TestLog, name: str = "example") -> Path | None:
+        """Load the submission into the work tree and compile it. Failures are recorded in `log`."""
         # 加入提交文件到工作树
-        if not self.worktree.set_root(folder):
+        self._folders[log.submitter] = folder
+        with tracer.span("find", "tester", submitter=log.submitter):
+            found = self.worktree.set_root(folder)
+        if not found:
             console.print("Failed to find submission", style="red")
             log.status = R.MISS().status
-            return log
+            return None
+
+        signatures = [self.compiler.signature()]
+        if self.fast_compiler:
+            signatures.append(self.fast_compiler.signature())
+        log.fingerprint = compile_fingerprint(self.worktree.files, self.worktree.includes, signatures)
+        if self._reuse_previous(log):
+            return None
 
         # 找到后编译
-        match self.worktree.compile_with(self.compiler):
+        if ce := self.triaged.get(log.submitter):
+            # 语法检查时已发现编译错误，不再完整编译
+            console.out(ce.details, end="", highlight=False)
+            built: Result[Path, R.CE] = Err(ce)
+        else:
+            with tracer.span("build", "tester", submitter=log.submitter):
+                built = self.worktree.compile_with(self.fast_compiler or self.compiler, name)
+        match built:
             case Ok(exe):
-                if self.run_tests(exe, log):
-                    console.print(
-                        f"Passed: {log.passed}/{len(self.testcases)}",
-                        style="bold green" if log.passed == len(self.testcases) else "bold red",
-                    )
-                    console.input("Press any key to continue...")
-                exe.unlink()
-
+                return exe
             case Err(e):
                 log.status = e.status
                 log.message = e.msg
+                log.details = e.details
                 console.print(e, style=e.color)
+                if self.pause:
+                    console.input("Press any key to continue...")
+                return None
+
+    def _reuse_previous(self, log: TestLog) -> bool:
+        """Take the previous results if neither the submission nor any test case has changed"""
+        prev = self.previous.get(log.submitter)
+        if not (prev and log.fingerprint and prev.fingerprint == log.fingerprint):
+            return False
+        if prev.result is None and prev.status != R.CE().status:
+            return False
+        if prev.result is not None and len(self.reusable(log)) < len(self.case_keys()):
+            return False
+
+        log.status = prev.status
+        log.message = prev.message
+        log.result = prev.result
+        log.passed = prev.passed
+        log.pending = prev.pending
+        log.score = prev.score
+        log.details = prev.details
+        console.print(f"Unchanged, reuse previous results. Passed: {log.passed}/{len(self.testcases)}", style="green")
+        return True
+
+    def judge(self, exe: Path, log: TestLog) -> None:
+        with tracer.span("judge", "tester", submitter=log.submitter):
+            completed = self.run_tests(exe, log)
+        if completed and self.fast_compiler:
+            with tracer.span("sanitize", "tester", submitter=log.submitter):
+                self.rerun_sanitized(log)
+        if completed:
+            console.print(
+                f"Passed: {log.passed}/{len(self.testcases)}"
+                + (f", score: {log.score:.2f}" if log.score != log.passed else "")
+                + (f", pending: {log.pending}" if log.pending else ""),
+                style="bold green" if log.passed == len(self.testcases) else "bold red",
+            )
+            if self.pause:
                 console.input("Press any key to continue...")
+        exe.unlink()
+
+    def rerun_sanitized(self, log: TestLog) -> None:
+        """Rebuild with `compiler` and rerun the cases that failed with the fast build
+
+        The verdicts of the fast build are kept, those of the rerun are recorded in `TestCaseLog.sanitized`.
+        """
+        assert log.result is not None
+        failed = [i for i, c in enumerate(log.result) if c.status in self.sanitize_statuses and c.sanitized is None]
+        if not failed:
+            return
+
+        console.print(f"Rebuild with sanitizers for cases {failed}", style="bold yellow")
+        # 评测线程可能与编译线程同时运行，使用独立的工作树
+        worktree = copy.deepcopy(self.worktree)
+        worktree.tmp_path = self.worktree.tmp_path / "sanitize"
+        worktree.tmp_path.mkdir(parents=True, exist_ok=True)
+        try:
+            worktree.set_root(self._folders[log.submitter])
+            built = worktree.compile_with(self.compiler, f"{log.submitter}-sanitized")
+            worktree.finish()
+            if isinstance(built, Err):
+                console.print(f"Sanitizer build failed: {built.err_value}", style=built.err_value.color)
+                return
+            exe = built.ok_value
+
+            inputs = self.testcases.inputs()
+            monitors = [
+                self.checker.monitor(i, self.testcases.answer(i)) if self.checker.monitors_output else None
+                for i in failed
+            ]
+            executions = self.runner.run_many(exe, [inputs[i] for i in failed], monitors)
+            exe.unlink()
+        finally:
+            worktree.cleanup()
+
+        # 重新运行只为获取诊断信息，不询问人工判定
+        checker = copy.copy(self.checker)
+        checker.interactive = False
+        for i, execution, monitor in zip(failed, executions, monitors, strict=True):
+            console.print(f"Case {i} (sanitized)", style="bold bright_blue")
+            match execution.result:
+                case Ok(out):
+                    res = monitor.finish() if execution.streamed and monitor else None
+                    if res is None:
+                        tc_in = self.testcases.stdin(i) if checker.needs_stdin else ""
+                        res = checker.check(i, stdin=tc_in, stdout=out, ans=self.testcases.answer(i))
+                    log.result[i].sanitized = RerunLog(res.status, res.msg, out)
+                case Err(res):
+                    log.result[i].sanitized = RerunLog(res.status, res.msg, str(res))
+            console.print(res.status, style=res.color, highlight=False, end=": ")
+            console.print(res.msg, highlight=False, markup=False)
+
+    def test_one(self, folder_: Path | str) -> TestLog:
+        folder = Path(folder_)
+        log = TestLog(folder.name)
+        console.print(f"Test {folder}", style="bold magenta")
 
-        self.worktree.finish()
+        with tracer.span("submission", "tester", submitter=log.submitter):
+            exe = self.build(folder, log)
+            self.worktree.finish()
+            if exe:
+                self.judge(exe, log)
 
         return log
 
-    def test_many(self, folder_: Path | str, save_path: Path | None = None) -> list[TestLog]:
+    def test_many(
+        self,
+        folder_: Path | str,
+        save_path: Path | None = None,
+        *,
+        jobs: int = 1,
+        pipeline: Pipeline | None = None,
+        batch: bool = False,
+        incremental: bool = False,
+        trace: Path | None = None,
+        triage: bool = False,
+    ) -> list[TestLog]:
+        """Test all submissions in a folder
+
+        Args:
+            folder_: folder containing one sub-folder per submitter
+            save_path: where to save the logs, in JSON Lines format. Each log is appended as soon as
+                its submission is done.
+            jobs: number of worker processes. Each worker has its own work tree under `worktree.tmp_path`,
+                and its console output is printed as a whole once the submission is done.
+                Manual judging is not available in workers.
+            pipeline: compile upcoming submissions in background threads while earlier ones are being tested.
+                Cannot be combined with `jobs`.
+            batch: never wait for input. Cases needing manual judgment are recorded as pending (PD),
+                to be judged later with `review_pending`. Implied by `jobs` and by multiple pipeline run workers.
+            incremental: reuse the results saved in `save_path` by a previous (possibly interrupted) run,
+                only recomputing submissions and test cases whose fingerprints have changed
+            trace: record the time spent in each stage, save it as a Chrome trace to this path
+                and print a summary. The recorded spans are then discarded. See `stutestpy.trace.tracer`
+                to trace other calls.
+            triage: first check all submissions with syntax-only compilations in `triage_workers` threads,
+                and only build those without compilation errors
+
+        Returns:
+            list[TestLog]: logs in the order of submitter folder names
+        """
+        if jobs > 1 and pipeline:
+            raise ValueError("`jobs` and `pipeline` cannot be used together")
         folder = Path(folder_)
         if save_path:
             save_path.parent.mkdir(parents=True, exist_ok=True)
 
+        self._case_keys = None
+        self.previous = {}
+        if incremental and save_path and save_path.exists():
+            self.previous = {log.submitter: log for log in load_logs(save_path)}
+        # 批量模式只在本次调用中生效
+        saved = self.pause, self.checker.interactive
+        if batch:
+            self.pause = False
+            self.checker.interactive = False
+        # 追踪同样只在本次调用中开启，导出后清空，避免混入之后的运行
+        tracing = tracer.enabled
+        if trace:
+            tracer.enable()
+
+        try:
+            return self._test_all(folder, save_path, jobs, pipeline, triage)
+        finally:
+            self.pause, self.checker.interactive = saved
+            if trace:
+                tracer.export_chrome(trace)
+                console.print(tracer.summary())
+                console.print(f"Save trace to {trace}", style="green")
+                if not tracing:
+                    tracer.disable()
+                tracer.drain()
+
+    def _test_all(
+        self, folder: Path, save_path: Path | None, jobs: int, pipeline: Pipeline | None, triage: bool
+    ) -> list[TestLog]:
+        folders = sorted(f for f in folder.iterdir() if f.is_dir() and f.name != "src")
+        self.triaged = {}
+        if triage:
+            from .triage import triage as run_triage
+
+            with console.status("Checking syntax..."):
+                self.triaged = run_triage(self, folders, self.triage_workers)
+            console.print(
+                f"Syntax check: {len(self.triaged)}/{len(folders)} submissions fail to compile", style="yellow"
+            )
+        if pipeline:
+            it = pipeline.run(self, folders)
+        elif jobs > 1:
+            from .parallel import test_parallel
+
+            it = test_parallel(self, folders, jobs)
+        else:
+            it = map(self.test_one, folders)
+
         logs: list[TestLog] = []
-        for f in folder.iterdir():
-            if not (f.is_dir() and f.name != "src"):
-                continue
-            logs.append(self.test_one(f))
-            if save_path:
-                logs_json = [t.to_dict() for t in logs]
-                save_path.write_text(json.dumps(logs_json, ensure_ascii=False, indent=2), encoding="utf-8")
+        # 每完成一个提交追加一行，而不是重写整个文件
+        writer = None
+        if save_path:
+            save_logs(save_path, list(self.previous.values()))
+            writer = LogWriter(save_path)
+        try:
+            for log in it:
+                logs.append(log)
+                if writer:
+                    writer.append(log)
+        finally:
+            if writer:
+                writer.close()
+            self.worktree.cleanup()
+        if save_path:
+            # 去掉被覆盖的旧记录
+            save_logs(save_path, logs)
 
         console.print("Test completed!", style="bold green")
+        if summary := self.compiler.summary():
+            console.print(summary, style="green")
 
         if save_path:
             console.print(f"Save logs to {save_path}", style="green")
-
         return logs
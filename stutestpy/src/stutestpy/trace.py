@@ -0,0 +1,123 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from rich.table import Table
+
+# 关闭时 span 返回同一个空上下文
+_DISABLED = contextlib.nullcontext()
+
+
+@dataclass
+class Span:
+    name: str
+    cat: str
+    start: int
+    """`time.monotonic_ns` at the start"""
+    dur: int
+    """Duration in nanoseconds"""
+    pid: int
+    tid: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    """Records timed spans of grading stages
+
+    Disabled by default, in which case `span` only checks a flag. Spans are kept in memory;
+    those of worker processes are merged with `extend`.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def span(self, name: str, cat: str = "", **args: Any) -> contextlib.AbstractContextManager[None]:
+        """Time the enclosed block"""
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name, cat, args)
+
+    @contextlib.contextmanager
+    def _timed(self, name: str, cat: str, args: dict[str, Any]) -> Iterator[None]:
+        start = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            self.add(name, cat, start, time.monotonic_ns() - start, **args)
+
+    def add(self, name: str, cat: str, start: int, dur: int, **args: Any) -> None:
+        """Record a span timed by the caller, with `time.monotonic_ns` values"""
+        if not self.enabled:
+            return
+        span = Span(name, cat, start, dur, os.getpid(), threading.get_native_id(), args)
+        with self._lock:
+            self.spans.append(span)
+
+    def drain(self) -> list[Span]:
+        """Remove and return the recorded spans"""
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+    def extend(self, spans: list[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    def export_chrome(self, path: Path) -> None:
+        """Save as Chrome trace events, viewable in chrome://tracing or Perfetto"""
+        with self._lock:
+            spans = list(self.spans)
+        origin = min((s.start for s in spans), default=0)
+        events = [
+            {
+                "name": s.name,
+                "cat": s.cat,
+                "ph": "X",
+                "ts": (s.start - origin) / 1000,
+                "dur": s.dur / 1000,
+                "pid": s.pid,
+                "tid": s.tid,
+                "args": s.args,
+            }
+            for s in spans
+        ]
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+
+    def summary(self) -> Table:
+        """Total, mean and max duration of each kind of span"""
+        groups: dict[tuple[str, str], list[int]] = defaultdict(list)
+        with self._lock:
+            for s in self.spans:
+                groups[(s.cat, s.name)].append(s.dur)
+
+        table = Table(title="Trace summary")
+        for col in ("category", "span", "count", "total (s)", "mean (ms)", "max (ms)"):
+            table.add_column(col, justify="left" if col in ("category", "span") else "right")
+        for (cat, name), durs in sorted(groups.items(), key=lambda x: -sum(x[1])):
+            table.add_row(
+                cat,
+                name,
+                str(len(durs)),
+                f"{sum(durs) / 1e9:.3f}",
+                f"{sum(durs) / len(durs) / 1e6:.2f}",
+                f"{max(durs) / 1e6:.2f}",
+            )
+        return table
+
+
+tracer = Tracer()
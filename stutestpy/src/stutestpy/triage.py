@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import copy
+import queue
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from result import Err
+
+from . import results as R
+from .trace import tracer
+
+if TYPE_CHECKING:
+    from .tester import Tester
+
+
+def triage(tester: Tester, folders: list[Path], workers: int) -> dict[str, R.CE]:
+    """Check all submissions for compilation errors with syntax-only compilations
+
+    Each thread loads submissions into its own copy of the work tree under `tmp_path/triage-{k}`.
+    Shared files (fixtures, reference copies) are not checked. Submissions that cannot be found,
+    or whose compiler does not support syntax checks, are left to the full build.
+
+    Returns:
+        dict[str, R.CE]: compilation errors by submitter, with the diagnostics in `details`
+    """
+    tasks: queue.SimpleQueue[Path | None] = queue.SimpleQueue()
+    for folder in folders:
+        tasks.put(folder)
+    failed: dict[str, R.CE] = {}
+    # 与首次构建使用相同的编译器，分级评测时即快速构建
+    compiler = tester.fast_compiler or tester.compiler
+    errors: list[BaseException] = []
+    lock = threading.Lock()
+
+    def work(k: int) -> None:
+        worktree = copy.deepcopy(tester.worktree)
+        worktree.tmp_path = tester.worktree.tmp_path / f"triage-{k}"
+        worktree.tmp_path.mkdir(parents=True, exist_ok=True)
+        try:
+            while (folder := tasks.get()) is not None:
+                with tracer.span("triage", "triage", submitter=folder.name):
+                    found = worktree.set_root(folder)
+                    sources = [f for f in worktree.sources if f not in worktree.shared_files]
+                    checked = None
+                    if found and sources:
+                        checked = compiler.check_syntax(sources, includes=worktree.includes)
+                    worktree.finish()
+                if isinstance(checked, Err):
+                    with lock:
+                        failed[folder.name] = checked.err_value
+        except BaseException as e:
+            with lock:
+                errors.append(e)
+        finally:
+            worktree.cleanup()
+
+    threads = [threading.Thread(target=work, args=(k,), daemon=True) for k in range(max(1, workers))]
+    for t in threads:
+        tasks.put(None)
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return failed
@@ -5,7 +5,7 @@ def auto_decode(bytes: bytes) -> str:
     try:
         return bytes.decode()
     except Exception as _:
-        return bytes.decode("gbk")
+        return bytes.decode("gbk", errors="replace")
 
 
 def colored(s: str, *, fg: str | None = None, bg: str | None = None, sty: str | None = None) -> str:
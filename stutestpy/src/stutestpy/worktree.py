@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import os
 import shutil
+import tempfile
+import weakref
 from abc import abstractmethod
 from pathlib import Path
 from typing import TYPE_CHECKING, override
 
-from result import Result
+from result import Err, Ok, Result
 
 from . import results as R
+from .index import INDEX_SUFFIXES, SubmissionIndex
 
 if TYPE_CHECKING:
     from .compiler import Compiler
@@ -30,7 +34,7 @@ class FixedLoader(TreeLoader):
     @override
     def load_to(self, worktree: WorkTree) -> bool:
         for loader in self.loaders:
-            if sub := loader.find_submission(worktree.root):
+            if sub := loader.find_in(worktree.index):
                 worktree.add_file(sub)
             else:
                 return False
@@ -44,12 +48,15 @@ class EnsuredLoader(TreeLoader):
     @override
     def load_to(self, worktree: WorkTree) -> bool:
         for name, alt in self.ensures:
-            f = worktree.root / name
-            if not f.exists():
+            f = worktree.index.get(name)
+            if f is None:
+                f = Path(name)
                 if f.suffix not in (".h", ".hpp"):
                     f = f.with_stem(f"{f.stem}-cp")
-                shutil.copyfile(alt, f)
-            worktree.add_file(f)
+                f = worktree.place(alt, f.as_posix())
+                worktree.add_file(f, shared=True)
+            else:
+                worktree.add_file(f)
         return True
 
 
@@ -64,13 +71,12 @@ class ConditionalLoader(TreeLoader):
 
     @override
     def load_to(self, worktree: WorkTree) -> bool:
-        if (f := worktree.root / self.cond_main).exists():
+        if f := worktree.index.get(self.cond_main):
             worktree.add_file(f)
-        elif all((worktree.root / a).exists() for a in self.alt_requires):
-            copied = worktree.root / self.alt.name
-            copied = copied.with_stem(f"{copied.stem}-cp")
-            copied = shutil.copyfile(self.alt, copied)
-            worktree.add_file(copied)
+        elif all(worktree.index.get(a) for a in self.alt_requires):
+            name = Path(self.alt.name)
+            copied = worktree.place(self.alt, name.with_stem(f"{name.stem}-cp").as_posix())
+            worktree.add_file(copied, shared=True)
             self.extras.append(copied)
         else:
             return False
@@ -80,36 +86,127 @@ class ConditionalLoader(TreeLoader):
     def unload(self, worktree: WorkTree) -> None:
         # for f in self.extras:
         #     f.unlink(missing_ok=True)
+        # 覆盖层模式下由 WorkTree.finish 清理
         self.extras.clear()
 
 
+def _link(source: Path, dest: Path) -> None:
+    """Hard link, or symbolic link across file systems, or copy as a last resort"""
+    dest.unlink(missing_ok=True)
+    try:
+        os.link(source, dest)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(source.resolve(), dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
 class WorkTree:
-    def __init__(self, tmp_path: StrPath, loader: TreeLoader, fixtures: list[StrPath] | None = None) -> None:
+    def __init__(
+        self,
+        tmp_path: StrPath,
+        loader: TreeLoader,
+        fixtures: list[StrPath] | None = None,
+        *,
+        index_suffixes: tuple[str, ...] | None = INDEX_SUFFIXES,
+        overlay: bool = False,
+        shm: bool = False,
+    ) -> None:
+        """
+        Args:
+            tmp_path: where binaries and shared objects are built
+            loader: loads the files of a submission
+            fixtures: files compiled with every submission
+            index_suffixes: suffixes of the files indexed when a submission folder is scanned, or None for all.
+                Other files are looked up directly.
+            overlay: never write to submission folders. Reference files that loaders provide are linked
+                into an overlay folder of a per-run build directory, searched after the submission folder.
+            shm: create the per-run build directory, where binaries are also written, in `/dev/shm`
+                if available, instead of under `tmp_path`
+        """
         self.tmp_path = Path(tmp_path)
         self.root = self.tmp_path
         self.loader = loader
+        self.index_suffixes = index_suffixes
+        self.overlay = overlay
+        self.shm = shm
+        self.build_path: Path | None = None
+        self._build_owner: Path | None = None
+        self.index = SubmissionIndex(self.root, [], index_suffixes)
+        self.obj_path = self.tmp_path / "objs"
         self.fixed_files: list[Path] = []
         self.files: list[Path] = []
+        # 所有提交共用的文件（夹具、复制的参考文件），只需编译一次
+        self.shared_files: set[Path] = set()
         if fixtures:
             for f in fixtures:
                 self.add_fixed(f)
 
     def add_fixed(self, file: StrPath) -> None:
         self.fixed_files.append(Path(file))
-        self.files.append(Path(file))
+        self.add_file(file, shared=True)
 
-    def add_file(self, file: StrPath) -> None:
+    def add_file(self, file: StrPath, *, shared: bool = False) -> None:
         self.files.append(Path(file))
+        if shared:
+            self.shared_files.add(Path(file))
 
     def reset(self) -> None:
         self.files = self.fixed_files.copy()
+        self.shared_files = set(self.fixed_files)
 
     def clear(self) -> None:
         self.files.clear()
         self.fixed_files.clear()
+        self.shared_files.clear()
+
+    def build_dir(self) -> Path:
+        """Per-run build directory, created on first use and removed by `cleanup` or at exit"""
+        # 复制的工作树（流水线、工作进程）修改了 tmp_path，各自使用独立目录
+        if self.build_path is None or self._build_owner != self.tmp_path:
+            base = "/dev/shm" if self.shm and os.path.isdir("/dev/shm") else self.tmp_path
+            self.build_path = Path(tempfile.mkdtemp(prefix="stutestpy-", dir=base))
+            self._build_owner = self.tmp_path
+            weakref.finalize(self, shutil.rmtree, self.build_path, ignore_errors=True)
+        return self.build_path
+
+    @property
+    def overlay_path(self) -> Path:
+        return self.build_dir() / "overlay"
+
+    @property
+    def includes(self) -> list[Path]:
+        """Include directories, the submission folder first"""
+        return [self.root, self.overlay_path] if self.overlay else [self.root]
+
+    def place(self, source: StrPath, name: str) -> Path:
+        """Provide a reference file to the submission as `name`
+
+        Copied into the submission folder, or linked into the overlay folder in overlay mode.
+        """
+        if not self.overlay:
+            dest = self.root / name
+            shutil.copyfile(source, dest)
+            self.index.add(dest)
+            return dest
+        dest = self.overlay_path / name
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        _link(Path(source), dest)
+        return dest
+
+    def cleanup(self) -> None:
+        """Remove the per-run build directory"""
+        if self.build_path is not None:
+            shutil.rmtree(self.build_path, ignore_errors=True)
+            self.build_path = None
 
     def set_root(self, root: StrPath) -> bool:
         self.root = Path(root)
+        # 只遍历一次提交文件夹，查找器和加载器都查询该索引
+        self.index = SubmissionIndex.scan(self.root, self.index_suffixes)
         self.reset()
         return self.loader.load_to(self)
 
@@ -117,12 +214,25 @@ class WorkTree:
     def sources(self) -> list[Path]:
         return [f for f in self.files if f.suffix in (".c", ".cc", ".cpp")]
 
-    def compile_with(
-        self,
-        compiler: Compiler,
-    ) -> Result[Path, R.CE]:
-        sources = self.sources
-        return compiler.compile(sources, self.tmp_path / "example.exe", includes=[self.root])
+    def compile_with(self, compiler: Compiler, name: str = "example") -> Result[Path, R.CE]:
+        includes = self.includes
+        sources: list[Path] = []
+        for f in self.sources:
+            if f not in self.shared_files:
+                sources.append(f)
+                continue
+            # 共用文件预编译为目标文件，只编译提交者自己的源文件
+            match compiler.compile_object(f, self.obj_path, includes=includes):
+                case Ok(obj):
+                    sources.append(obj)
+                case Err() as e:
+                    return e
+                case None:
+                    sources.append(f)
+        exe_dir = self.build_dir() if self.overlay or self.shm else self.tmp_path
+        return compiler.compile(sources, exe_dir / f"{name}.exe", includes=includes)
 
     def finish(self) -> None:
         self.loader.unload(self)
+        if self.overlay and self.build_path is not None:
+            shutil.rmtree(self.build_path / "overlay", ignore_errors=True)
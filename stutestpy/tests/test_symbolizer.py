@@ -0,0 +1,27 @@
+from pathlib import Path
+from typing import override
+
+from stutestpy.symbolizer import Symbol, Symbolizer
+
+
+class FakeSymbolizer(Symbolizer):
+    """Resolves every offset to the same location, without calling a tool"""
+
+    @override
+    def _resolve(self, module: str, offsets: list[int]) -> list[Symbol]:
+        return [("main", "/tmp/a.cpp:3:5") for _ in offsets]
+
+
+def test_frame(tmp_path: Path) -> None:
+    exe = tmp_path / "a.exe"
+    exe.write_bytes(b"\x7fELF")
+    frame = f"    #0 0x4f1255  ({exe}+0x1255)"
+    assert FakeSymbolizer("llvm-symbolizer").symbolize(frame) == "    #0 0x4f1255 in main /tmp/a.cpp:3:5"
+
+
+def test_frame_with_build_id(tmp_path: Path) -> None:
+    # compiler-rt 15 起的格式
+    exe = tmp_path / "a.exe"
+    exe.write_bytes(b"\x7fELF")
+    frame = f"    #0 0x4f1255 ({exe}+0x1255) (BuildId: abcdef)"
+    assert FakeSymbolizer("llvm-symbolizer").symbolize(frame) == "    #0 0x4f1255 in main /tmp/a.cpp:3:5"